@@ -0,0 +1,117 @@
+"""Classifica dei contributi al payload inviato al browser, dai record di utils/payload_accounting.py.
+
+Uso:
+    python -m analysis.payload_report data/payload.jsonl
+    python -m analysis.payload_report data/payload.jsonl --page art_viewing --top 30
+
+Per pagina: run misurati, byte per run (media, mediana, p95) ed elementi per run. Poi i punti
+di chiamata (file:riga e tipo di elemento) ordinati per byte totali, con la quota sul totale
+e i byte medi per run della pagina: un elemento piccolo ripetuto a ogni rerun pesa quanto
+un'immagine inviata una volta.
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+
+def load_records(path, pages=None):
+    records = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if not pages or record["app_state"] in pages:
+                    records.append(record)
+    return records
+
+
+def page_summary(records):
+    by_page = defaultdict(list)
+    for record in records:
+        by_page[record["app_state"]].append(record)
+    rows = []
+    for page, page_records in by_page.items():
+        sizes = np.array([record["bytes"] for record in page_records], dtype=np.float64)
+        rows.append({
+            "app_state": page,
+            "runs": len(page_records),
+            "total_bytes": int(sizes.sum()),
+            "mean_bytes": float(sizes.mean()),
+            "median_bytes": float(np.median(sizes)),
+            "p95_bytes": float(np.percentile(sizes, 95)),
+            "mean_elements": float(np.mean([record["elements"] for record in page_records])),
+        })
+    return sorted(rows, key=lambda row: row["total_bytes"], reverse=True)
+
+
+def site_ranking(records):
+    runs_per_page = defaultdict(int)
+    totals = defaultdict(lambda: [0, 0])
+    for record in records:
+        runs_per_page[record["app_state"]] += 1
+        for key, entry in record["by_site"].items():
+            total = totals[(record["app_state"], key)]
+            total[0] += entry["bytes"]
+            total[1] += entry["count"]
+    grand_total = sum(size for size, _ in totals.values()) or 1
+    rows = []
+    for (page, key), (size, count) in totals.items():
+        site, _, kind = key.rpartition(" ")
+        runs = runs_per_page[page]
+        rows.append({
+            "app_state": page,
+            "site": site,
+            "kind": kind,
+            "total_bytes": size,
+            "share": size / grand_total,
+            "bytes_per_run": size / runs,
+            "messages_per_run": count / runs,
+        })
+    return sorted(rows, key=lambda row: row["total_bytes"], reverse=True)
+
+
+def _format_bytes(size):
+    for unit, scale in (("MB", 1e6), ("KB", 1e3)):
+        if size >= scale:
+            return f"{size / scale:.1f} {unit}"
+    return f"{size:.0f} B"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Contributi più pesanti al payload per pagina")
+    parser.add_argument("path", help="file JSONL scritto da utils/payload_accounting.py")
+    parser.add_argument("--page", action="append", help="app_state da includere (ripetibile)")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="stampa il report in JSON")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.path, args.page)
+    if not records:
+        print(f"Nessun run misurato in {args.path}", file=sys.stderr)
+        return 1
+    pages = page_summary(records)
+    sites = site_ranking(records)[:args.top]
+
+    if args.json:
+        json.dump({"pages": pages, "sites": sites}, sys.stdout, indent=2)
+        print()
+        return 0
+
+    print(f"{'pagina':14} {'run':>6} {'media/run':>11} {'mediana':>11} {'p95':>11} {'elementi/run':>13}")
+    for row in pages:
+        print(f"{row['app_state']:14} {row['runs']:6} {_format_bytes(row['mean_bytes']):>11} "
+              f"{_format_bytes(row['median_bytes']):>11} {_format_bytes(row['p95_bytes']):>11} "
+              f"{row['mean_elements']:13.1f}")
+    print()
+    print(f"{'quota':>7} {'per run':>10} {'msg/run':>8}  {'pagina':14} {'tipo':14} punto di chiamata")
+    for row in sites:
+        print(f"{row['share']:7.1%} {_format_bytes(row['bytes_per_run']):>10} {row['messages_per_run']:8.1f}  "
+              f"{row['app_state']:14} {row['kind']:14} {row['site']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
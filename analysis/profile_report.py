@@ -0,0 +1,99 @@
+"""Confronta i profili per pagina scritti da utils/profiling.py.
+
+Uso:
+    python -m analysis.profile_report data/profiles
+    python -m analysis.profile_report data/profiles --page recall --page art_viewing --top 15
+    python -m analysis.profile_report data/profiles --sort tottime
+
+Unisce i file di tutti i processi della stessa pagina e mostra, per ciascuna, le funzioni più
+costose dai .pstats e i frame più presenti negli stack campionati (.collapsed).
+"""
+import argparse
+import glob
+import io
+import os
+import pstats
+import sys
+from collections import Counter, defaultdict
+
+
+def _page_of(path):
+    # <app_state>.<pid>.<estensione>
+    return os.path.basename(path).split(".")[0]
+
+
+def load_pstats(directory):
+    pages = defaultdict(list)
+    for path in glob.glob(os.path.join(directory, "*.pstats")):
+        pages[_page_of(path)].append(path)
+    return {page: pstats.Stats(*paths) for page, paths in pages.items()}
+
+
+def load_collapsed(directory):
+    pages = defaultdict(Counter)
+    for path in glob.glob(os.path.join(directory, "*.collapsed")):
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack:
+                    pages[_page_of(path)][stack] += int(count)
+    return pages
+
+
+def self_and_total(stacks):
+    """Campioni per frame: in cima allo stack (self) e presenti nello stack (totale)"""
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return own, total
+
+
+def _pstats_summary(stats, sort, top):
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(sort).print_stats(top)
+    # Solo la tabella: l'intestazione di pstats elenca i file di origine
+    lines = out.getvalue().splitlines()
+    start = next((i for i, line in enumerate(lines) if "ncalls" in line), 0)
+    return "\n".join(lines[start:]).rstrip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Confronto dei profili per app_state")
+    parser.add_argument("directory", help="cartella dei profili (STUDY_PROFILE_DIR)")
+    parser.add_argument("--page", action="append", help="app_state da includere (ripetibile)")
+    parser.add_argument("--sort", default="cumulative", choices=["cumulative", "tottime", "ncalls"])
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    profiles = load_pstats(args.directory)
+    samples = load_collapsed(args.directory)
+    pages = sorted(set(profiles) | set(samples))
+    if args.page:
+        pages = [page for page in pages if page in args.page]
+    if not pages:
+        print(f"Nessun profilo in {args.directory}", file=sys.stderr)
+        return 1
+
+    for page in pages:
+        print(f"=== {page} ===")
+        if page in profiles:
+            stats = profiles[page]
+            print(f"cProfile: {stats.total_calls} chiamate, {stats.total_tt:.3f}s")
+            print(_pstats_summary(stats, args.sort, args.top))
+        if page in samples:
+            own, total = self_and_total(samples[page])
+            count = sum(samples[page].values())
+            print(f"campioni: {count}")
+            print(f"{'self':>7} {'totale':>7}  frame")
+            for frame, self_count in own.most_common(args.top):
+                print(f"{self_count / count:7.1%} {total[frame] / count:7.1%}  {frame}")
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
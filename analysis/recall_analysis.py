@@ -0,0 +1,337 @@
+"""Analisi offline dei punteggi di recall, interamente vettorizzata con NumPy.
+
+Uso:
+    python -m analysis.recall_analysis --export-dir export/
+    python -m analysis.recall_analysis --synthetic 100000 --resamples 5000
+
+Le risposte esportate (una riga per partecipante/opera/domanda) diventano una matrice
+partecipanti x domande; la correttezza è ricalcolata dalle chiavi della banca domande,
+così una correzione a recall_questions.json vale anche per i dati già raccolti.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from database.recall_questions import load_question_bank
+
+DEFAULT_RESAMPLES = 2000
+CONFIDENCE = 0.95
+# Limite di elementi per blocco di ricampionamento (B x valori distinti), per contenere la memoria
+BOOTSTRAP_BLOCK_ELEMENTS = 4_000_000
+
+ItemKey = namedtuple("ItemKey", ["artwork_id", "question_key"])
+
+
+class RecallMatrix:
+    """Risposte di recall in forma matriciale.
+
+    correct:   (P, I) float32, 1/0 per risposta corretta/errata, NaN se la domanda manca
+    positions: (P, A) int16, posizione (0 = prima) dell'opera nell'ordine di visione, -1 se ignota
+    groups:    (P,) int, indice in group_labels
+    """
+
+    def __init__(self, participant_ids, group_labels, groups, items, artwork_ids, item_artwork, correct, positions):
+        self.participant_ids = participant_ids
+        self.group_labels = group_labels
+        self.groups = groups
+        self.items = items
+        self.artwork_ids = artwork_ids
+        self.item_artwork = item_artwork
+        self.correct = correct
+        self.positions = positions
+
+    @property
+    def answered(self):
+        return ~np.isnan(self.correct)
+
+    def participant_accuracy(self):
+        with np.errstate(invalid="ignore"):
+            return np.nanmean(self.correct, axis=1)
+
+    def artwork_accuracy(self):
+        """(P, A): quota di risposte corrette per partecipante e opera"""
+        answered = self.answered
+        values = np.where(answered, self.correct, 0.0)
+        onehot = (self.item_artwork[:, None] == np.arange(len(self.artwork_ids))[None, :]).astype(np.float32)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (values @ onehot) / (answered.astype(np.float32) @ onehot)
+
+    def __len__(self):
+        return len(self.participant_ids)
+
+
+def _bank_items(question_bank):
+    items, correct_answers, item_artwork = [], [], []
+    artwork_ids = list(question_bank.order)
+    for artwork_index, artwork_id in enumerate(artwork_ids):
+        for i, question in enumerate(question_bank.by_id[artwork_id].questions):
+            # Le chiavi salvate da recall_page sono q_1, q_2, ...
+            items.append(ItemKey(artwork_id, f"q_{i+1}"))
+            correct_answers.append(question.options[question.correct_index])
+            item_artwork.append(artwork_index)
+    return items, np.array(correct_answers, dtype=object), np.array(item_artwork, dtype=np.int32), artwork_ids
+
+
+def build_matrix(columns, question_bank):
+    """Costruisce la RecallMatrix dalle colonne della tabella responses dell'esportazione.
+
+    columns: mapping con participant_id, experimental_group, artwork_id, artwork_position,
+    question_key, answer (liste o array della stessa lunghezza). Le righe ripetute per lo stesso
+    partecipante e domanda si sovrascrivono: vale l'ultima.
+    """
+    items, correct_answers, item_artwork, artwork_ids = _bank_items(question_bank)
+    item_index = {f"{item.artwork_id}\x1f{item.question_key}": i for i, item in enumerate(items)}
+
+    artwork_ids_seen, row_artwork = _factorize(columns["artwork_id"])
+    keys_seen, row_key = _factorize(columns["question_key"])
+    # Pochi valori distinti: si mappano le coppie (opera, domanda) con una tabella di lookup
+    lookup = np.array(
+        [[item_index.get(f"{artwork_id}\x1f{key}", -1) for key in keys_seen] for artwork_id in artwork_ids_seen],
+        dtype=np.int64,
+    ).reshape(len(artwork_ids_seen), len(keys_seen))
+    row_item = lookup[row_artwork, row_key]
+    known = row_item >= 0
+    row_item = row_item[known]
+
+    participant_ids, row_participant = _factorize(np.asarray(columns["participant_id"], dtype=object)[known])
+    group_labels, row_group = _factorize(np.asarray(columns["experimental_group"], dtype=object)[known])
+    # Gruppi in ordine alfabetico, per un report stabile tra un'esportazione e l'altra
+    group_labels = [str(label) for label in group_labels]
+    group_order = np.argsort(group_labels)
+    row_group = np.argsort(group_order)[row_group]
+    group_labels = [group_labels[i] for i in group_order]
+    answers = np.asarray(columns["answer"], dtype=object)[known]
+
+    n_participants = len(participant_ids)
+    correct = np.full((n_participants, len(items)), np.nan, dtype=np.float32)
+    correct[row_participant, row_item] = (answers == correct_answers[row_item]).astype(np.float32)
+
+    groups = np.zeros(n_participants, dtype=np.int64)
+    groups[row_participant] = row_group
+
+    positions = np.full((n_participants, len(artwork_ids)), -1, dtype=np.int16)
+    # None (posizione sconosciuta) diventa NaN
+    row_position = np.asarray(columns["artwork_position"], dtype=np.float64)[known]
+    has_position = ~np.isnan(row_position)
+    positions[row_participant[has_position], item_artwork[row_item[has_position]]] = row_position[has_position].astype(np.int16)
+
+    return RecallMatrix(
+        np.array(participant_ids, dtype=object), group_labels, groups,
+        items, artwork_ids, item_artwork, correct, positions,
+    )
+
+
+def _factorize(values):
+    """Valori distinti in ordine di prima comparsa e codice intero di ogni elemento.
+
+    Con un dizionario si evita l'ordinamento di milioni di stringhe fatto da np.unique.
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int64, count=len(values))
+    return list(index), codes
+
+
+def _masked_corr(x, y, mask):
+    """Correlazione di Pearson colonna per colonna considerando solo le celle in mask"""
+    weights = mask.astype(np.float64)
+    n = weights.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = (x * weights).sum(axis=0) / n
+        mean_y = (y * weights).sum(axis=0) / n
+        dx = (x - mean_x) * weights
+        dy = (y - mean_y) * weights
+        return (dx * dy).sum(axis=0) / np.sqrt((dx * dx).sum(axis=0) * (dy * dy).sum(axis=0))
+
+
+def item_statistics(matrix):
+    """Difficoltà (quota di risposte corrette) e discriminazione (correlazione item-resto) per domanda"""
+    answered = matrix.answered
+    values = np.where(answered, matrix.correct, 0.0).astype(np.float64)
+    n = answered.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        difficulty = values.sum(axis=0) / n
+    # Punteggio totale senza la domanda stessa, per non gonfiare la correlazione
+    rest = values.sum(axis=1, keepdims=True) - values
+    discrimination = _masked_corr(values, rest, answered)
+
+    return [
+        {
+            "artwork_id": item.artwork_id,
+            "question_key": item.question_key,
+            "responses": int(n[i]),
+            "difficulty": _round(difficulty[i]),
+            "discrimination": _round(discrimination[i]),
+        }
+        for i, item in enumerate(matrix.items)
+    ]
+
+
+def bootstrap_means(values, resamples=DEFAULT_RESAMPLES, rng=None):
+    """Medie bootstrap di values, come vettore di lunghezza resamples.
+
+    Ricampionare n valori con reinserimento equivale a estrarre dalla multinomiale sui valori
+    distinti (le accuratezze hanno pochi livelli), quindi ogni blocco è un prodotto matrice-vettore.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.full(resamples, np.nan)
+    levels, counts = np.unique(values, return_counts=True)
+    probabilities = counts / counts.sum()
+    block = max(1, BOOTSTRAP_BLOCK_ELEMENTS // len(levels))
+    means = np.empty(resamples)
+    for start in range(0, resamples, block):
+        stop = min(resamples, start + block)
+        draws = rng.multinomial(len(values), probabilities, size=stop - start)
+        means[start:stop] = draws @ levels / len(values)
+    return means
+
+
+def _interval(samples, confidence=CONFIDENCE):
+    alpha = (1 - confidence) / 2
+    low, high = np.nanquantile(samples, [alpha, 1 - alpha])
+    return [_round(low), _round(high)]
+
+
+def group_means(matrix, resamples=DEFAULT_RESAMPLES, seed=None, confidence=CONFIDENCE):
+    """Accuratezza media per gruppo con intervallo bootstrap percentile e differenze tra gruppi"""
+    rng = np.random.default_rng(seed)
+    accuracy = matrix.participant_accuracy()
+    groups, boots = {}, {}
+    for code, label in enumerate(matrix.group_labels):
+        values = accuracy[matrix.groups == code]
+        boots[label] = bootstrap_means(values, resamples, rng)
+        groups[label] = {
+            "participants": int(len(values)),
+            "mean_accuracy": _round(np.nanmean(values)) if len(values) else None,
+            "ci": _interval(boots[label], confidence),
+        }
+
+    # Campioni indipendenti: la differenza delle medie bootstrap dà l'intervallo della differenza
+    differences = {}
+    labels = matrix.group_labels
+    for i, first in enumerate(labels):
+        for second in labels[i + 1:]:
+            diff = boots[first] - boots[second]
+            differences[f"{first}-{second}"] = {
+                "mean_difference": _round(groups[first]["mean_accuracy"] - groups[second]["mean_accuracy"])
+                if groups[first]["mean_accuracy"] is not None and groups[second]["mean_accuracy"] is not None else None,
+                "ci": _interval(diff, confidence),
+            }
+    return {"groups": groups, "differences": differences}
+
+
+def order_effect(matrix):
+    """Accuratezza per posizione di presentazione, per opera, e pendenza lineare sulla posizione"""
+    accuracy = matrix.artwork_accuracy()
+    positions = matrix.positions.astype(np.int64)
+    valid = (positions >= 0) & ~np.isnan(accuracy)
+    n_positions = len(matrix.artwork_ids)
+
+    flat_positions = positions[valid]
+    flat_accuracy = accuracy[valid].astype(np.float64)
+    flat_artworks = np.broadcast_to(np.arange(n_positions), positions.shape)[valid]
+
+    counts = np.bincount(flat_positions, minlength=n_positions)
+    sums = np.bincount(flat_positions, weights=flat_accuracy, minlength=n_positions)
+
+    cells = flat_artworks * n_positions + flat_positions
+    cell_counts = np.bincount(cells, minlength=n_positions * n_positions).reshape(n_positions, n_positions)
+    cell_sums = np.bincount(cells, weights=flat_accuracy, minlength=n_positions * n_positions).reshape(n_positions, n_positions)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        by_position = sums / counts
+        by_artwork = cell_sums / cell_counts
+        # Minimi quadrati di accuratezza ~ posizione
+        x = flat_positions - flat_positions.mean()
+        slope = (x * (flat_accuracy - flat_accuracy.mean())).sum() / (x * x).sum()
+
+    return {
+        "by_position": [
+            {"position": p + 1, "observations": int(counts[p]), "mean_accuracy": _round(by_position[p])}
+            for p in range(n_positions)
+        ],
+        "by_artwork": {
+            artwork_id: [_round(value) for value in by_artwork[a]]
+            for a, artwork_id in enumerate(matrix.artwork_ids)
+        },
+        "slope_per_position": _round(slope),
+    }
+
+
+def analyze(matrix, resamples=DEFAULT_RESAMPLES, seed=None):
+    return {
+        "participants": len(matrix),
+        "items": item_statistics(matrix),
+        "group_means": group_means(matrix, resamples, seed),
+        "order_effect": order_effect(matrix),
+    }
+
+
+def _round(value, digits=4):
+    if value is None or np.isnan(value):
+        return None
+    return round(float(value), digits)
+
+
+def load_export_columns(export_dir):
+    """Concatena le tabelle responses-*.parquet (o .csv) scritte da export_participants.py"""
+    names = ["participant_id", "experimental_group", "artwork_id", "artwork_position", "question_key", "answer"]
+    paths = sorted(glob.glob(os.path.join(export_dir, "responses-*.parquet")))
+    if paths:
+        import pyarrow.parquet as pq
+        tables = [pq.read_table(path, columns=names) for path in paths]
+        return {name: np.concatenate([table.column(name).to_numpy(zero_copy_only=False) for table in tables]) for name in names}
+
+    import csv
+    columns = {name: [] for name in names}
+    for path in sorted(glob.glob(os.path.join(export_dir, "responses-*.csv"))):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                for name in names:
+                    columns[name].append(row[name])
+    columns["artwork_position"] = [int(p) if p else None for p in columns["artwork_position"]]
+    return columns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analisi offline dei punteggi di recall")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--export-dir", help="cartella prodotta da export_participants.py")
+    source.add_argument("--synthetic", type=int, metavar="N", help="genera N partecipanti sintetici")
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    question_bank = load_question_bank()
+    start = time.perf_counter()
+    if args.synthetic:
+        from analysis.synthetic import generate_responses
+        columns = generate_responses(args.synthetic, question_bank, seed=args.seed)
+    else:
+        columns = load_export_columns(args.export_dir)
+    loaded = time.perf_counter()
+
+    matrix = build_matrix(columns, question_bank)
+    built = time.perf_counter()
+    report = analyze(matrix, args.resamples, args.seed)
+    done = time.perf_counter()
+
+    report["timings_seconds"] = {
+        "load": round(loaded - start, 3),
+        "build_matrix": round(built - loaded, 3),
+        "analyze": round(done - built, 3),
+    }
+    json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
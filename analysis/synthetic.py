@@ -0,0 +1,68 @@
+"""Generatore di risposte di recall sintetiche, nello stesso formato della tabella responses esportata.
+
+Le risposte seguono un modello logistico a due parametri: abilità del partecipante (spostata
+per gruppo), difficoltà e discriminazione della domanda, più un effetto della posizione di
+visione dell'opera. Serve per provare l'analisi su volumi realistici senza dati veri.
+"""
+import numpy as np
+
+DEFAULT_GROUPS = ("A", "B", "C")
+GROUP_SHIFT = {"A": 0.0, "B": 0.25, "C": -0.15}
+# Effetto primacy/recency: vantaggio della prima e dell'ultima opera viste
+POSITION_SHIFT = (0.2, -0.1, 0.1)
+
+
+def generate_responses(n_participants, question_bank, groups=DEFAULT_GROUPS, seed=None):
+    """Colonne (array NumPy) di una tabella responses con n_participants partecipanti completi"""
+    rng = np.random.default_rng(seed)
+    artwork_ids = list(question_bank.order)
+    n_artworks = len(artwork_ids)
+
+    options, correct_index, item_artwork, question_keys = [], [], [], []
+    for artwork_index, artwork_id in enumerate(artwork_ids):
+        for i, question in enumerate(question_bank.by_id[artwork_id].questions):
+            options.append(question.options)
+            correct_index.append(question.correct_index)
+            item_artwork.append(artwork_index)
+            question_keys.append(f"q_{i+1}")
+    n_items = len(options)
+    max_options = max(len(o) for o in options)
+    option_table = np.array([list(o) + [o[-1]] * (max_options - len(o)) for o in options], dtype=object)
+    option_counts = np.array([len(o) for o in options])
+    correct_index = np.array(correct_index)
+    item_artwork = np.array(item_artwork)
+
+    item_difficulty = rng.normal(-0.3, 0.8, n_items)
+    item_discrimination = rng.uniform(0.6, 2.0, n_items)
+
+    group_codes = rng.integers(0, len(groups), n_participants)
+    shifts = np.array([GROUP_SHIFT.get(group, 0.0) for group in groups])
+    ability = rng.normal(0.0, 1.0, n_participants) + shifts[group_codes]
+
+    # Ordine di visione casuale per partecipante: argsort di rumore uniforme
+    positions = np.argsort(np.argsort(rng.random((n_participants, n_artworks)), axis=1), axis=1)
+    position_shift = np.resize(np.array(POSITION_SHIFT, dtype=np.float64), n_artworks)
+    item_position = positions[:, item_artwork]
+
+    logits = item_discrimination * (ability[:, None] + position_shift[item_position] - item_difficulty)
+    is_correct = rng.random((n_participants, n_items)) < 1 / (1 + np.exp(-logits))
+
+    # Risposta errata: un'opzione a caso diversa da quella corretta
+    wrong_offset = 1 + (rng.random((n_participants, n_items)) * (option_counts - 1)).astype(np.int64)
+    chosen = np.where(is_correct, correct_index, (correct_index + wrong_offset) % option_counts)
+    answers = option_table[np.arange(n_items), chosen]
+
+    participant_ids = np.char.add("S_", np.char.zfill(np.arange(n_participants).astype(str), 7)).astype(object)
+    group_labels = np.array(groups, dtype=object)[group_codes]
+    artwork_table = np.array(artwork_ids, dtype=object)
+
+    return {
+        "participant_id": np.repeat(participant_ids, n_items),
+        "experimental_group": np.repeat(group_labels, n_items),
+        "artwork_id": np.tile(artwork_table[item_artwork], n_participants),
+        "artwork_position": item_position.ravel(),
+        "question_key": np.tile(np.array(question_keys, dtype=object), n_participants),
+        "answer": answers.ravel(),
+        "correct_answer": np.tile(option_table[np.arange(n_items), correct_index], n_participants),
+        "is_correct": is_correct.ravel(),
+    }
@@ -0,0 +1,134 @@
+"""Ricostruisce il percorso di un partecipante dagli span OTLP/JSON scritti da utils/tracing.py.
+
+Uso:
+    python -m analysis.trace_timeline data/traces.jsonl                     # partecipanti più lenti
+    python -m analysis.trace_timeline data/traces.jsonl --participant P_X   # percorso di uno solo
+
+Il percorso è l'albero degli span della traccia in ordine di inizio, con scostamento
+dall'inizio dello studio e durata; le fasi (app_state) sono le radici.
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+
+def _attribute_value(value):
+    for key in ("stringValue", "boolValue", "doubleValue"):
+        if key in value:
+            return value[key]
+    return int(value["intValue"]) if "intValue" in value else None
+
+
+def load_spans(path):
+    spans = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource_spans in json.loads(line).get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for span in scope_spans.get("spans", []):
+                        spans.append({
+                            "trace_id": span["traceId"],
+                            "span_id": span["spanId"],
+                            "parent_id": span.get("parentSpanId"),
+                            "name": span["name"],
+                            "start": int(span["startTimeUnixNano"]) / 1e9,
+                            "end": int(span["endTimeUnixNano"]) / 1e9,
+                            "error": span.get("status", {}).get("message"),
+                            "attributes": {a["key"]: _attribute_value(a["value"]) for a in span.get("attributes", [])},
+                        })
+    return spans
+
+
+def group_by_trace(spans):
+    traces = defaultdict(list)
+    for span in spans:
+        traces[span["trace_id"]].append(span)
+    return traces
+
+
+def participant_of(trace_spans):
+    # Le fasi iniziali (consenso, demografia) precedono l'assegnazione dell'id
+    for span in trace_spans:
+        participant_id = span["attributes"].get("participant.id")
+        if participant_id:
+            return participant_id
+    return None
+
+
+def summarize(traces):
+    """Una riga per traccia: partecipante, durata complessiva e fase più lunga"""
+    rows = []
+    for trace_id, trace_spans in traces.items():
+        phases = [span for span in trace_spans if span["parent_id"] is None]
+        slowest = max(phases, key=lambda span: span["end"] - span["start"], default=None)
+        rows.append({
+            "trace_id": trace_id,
+            "participant_id": participant_of(trace_spans),
+            "duration": max(span["end"] for span in trace_spans) - min(span["start"] for span in trace_spans),
+            "spans": len(trace_spans),
+            "slowest_phase": slowest["attributes"].get("app_state") if slowest else None,
+            "errors": sum(1 for span in trace_spans if span["error"]),
+        })
+    return sorted(rows, key=lambda row: row["duration"], reverse=True)
+
+
+def timeline(trace_spans):
+    """Righe (profondità, span) in ordine di inizio, ogni figlio sotto il suo genitore"""
+    known = {span["span_id"] for span in trace_spans}
+    children = defaultdict(list)
+    for span in trace_spans:
+        # Un genitore non esportato (campionamento, crash) non deve nascondere i figli
+        children[span["parent_id"] if span["parent_id"] in known else None].append(span)
+    rows = []
+
+    def visit(parent_id, depth):
+        for span in sorted(children[parent_id], key=lambda span: span["start"]):
+            rows.append((depth, span))
+            visit(span["span_id"], depth + 1)
+
+    visit(None, 0)
+    return rows
+
+
+def print_timeline(trace_spans, out=sys.stdout):
+    origin = min(span["start"] for span in trace_spans)
+    for depth, span in timeline(trace_spans):
+        details = {k: v for k, v in span["attributes"].items() if k != "participant.id"}
+        detail_text = " ".join(f"{key}={value}" for key, value in details.items())
+        error = f"  ERRORE: {span['error']}" if span["error"] else ""
+        print(f"{span['start'] - origin:9.2f}s {span['end'] - span['start']:9.3f}s  "
+              f"{'  ' * depth}{span['name']}  {detail_text}{error}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Percorso dei partecipanti dagli span esportati")
+    parser.add_argument("path", help="file JSONL scritto da utils/tracing.py")
+    parser.add_argument("--participant", help="mostra il percorso di questo participant_id")
+    parser.add_argument("--trace", help="mostra il percorso di questo trace_id")
+    parser.add_argument("--top", type=int, default=20, help="tracce più lunghe da elencare")
+    args = parser.parse_args(argv)
+
+    traces = group_by_trace(load_spans(args.path))
+    if args.participant or args.trace:
+        matches = [spans for trace_id, spans in traces.items()
+                   if trace_id == args.trace or (args.participant and participant_of(spans) == args.participant)]
+        if not matches:
+            print("Nessuna traccia trovata", file=sys.stderr)
+            return 1
+        for trace_spans in matches:
+            print(f"traccia {trace_spans[0]['trace_id']}  partecipante {participant_of(trace_spans)}")
+            print_timeline(trace_spans)
+        return 0
+
+    print(f"{'partecipante':16} {'durata':>10} {'span':>6} {'errori':>7}  fase più lunga")
+    for row in summarize(traces)[:args.top]:
+        print(f"{row['participant_id'] or '-':16} {row['duration']:9.1f}s {row['spans']:6} {row['errors']:7}  "
+              f"{row['slowest_phase'] or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
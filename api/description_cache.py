@@ -0,0 +1,107 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from utils.cache_lifecycle import cached_resource
+
+DEFAULT_MAX_SIZE = 256
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+def make_cache_key(model, system_prompt, user_prompt, sampling_params):
+    payload = json.dumps({
+        "model": model,
+        "system": system_prompt,
+        "user": user_prompt,
+        "params": sampling_params,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DescriptionCache:
+    """Cache LRU/TTL condivisa tra le sessioni, con coalescenza delle richieste concorrenti"""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put_locked(key, value)
+
+    def _put_locked(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.stats["hits"] += 1
+                return value
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                owner = False
+            else:
+                self.stats["misses"] += 1
+                future = Future()
+                self._in_flight[key] = future
+                owner = True
+
+        if not owner:
+            # Un'altra sessione sta già chiamando il modello per questo prompt
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            # I fallimenti (None) non vengono memorizzati: si riproverà alla prossima richiesta
+            if value is not None:
+                self._put_locked(key, value)
+            del self._in_flight[key]
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+@cached_resource("description_cache", show_spinner=False)
+def get_description_cache():
+    return DescriptionCache()
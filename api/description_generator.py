@@ -1,14 +1,51 @@
 import streamlit as st
-import requests
 import json
+import logging
 import time
+from api.description_cache import get_description_cache, make_cache_key
+from api.http_client import CircuitOpenError, get_http_client
+from database.description_store import get_description_store, hash_text
+from utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+MODEL = "openai/gpt-4o-mini-2024-07-18"
+SAMPLING_PARAMS = {
+    "max_tokens": 300,
+    "temperature": 0.0,  # ZERO creatività
+    "top_p": 0.1
+}
+SYSTEM_PROMPT = """SEI UNA GUIDA MUSEALE CHE DEVE ESSERE MOLTO CONCISA.
+                        
+    REGOLE DI SCRITTURA:
+    1. SOLO FATTI, NIENTE INTERPRETAZIONI
+    2. NIENTE "invita a", "suggerisce", "esplora", "celebra"
+    3. NIENTE aggettivi descrittivi (ricca, unica, emblematica)
+    4. NIENTE riflessioni filosofiche
+    5. FRASI BREVI E DIRETTE
+    6. SOLO informazioni dall'utente
+
+    ESEMPIO DI COME SCRIVI:
+    "Artista, 'Titolo' (anno). Tecnica.
+    Elemento 1. Elemento 2.
+    Significato 1. Significato 2."
+
+    NON AGGIUNGERE NULLA DI TUO."""
+
+OPENROUTER_SECONDS = metrics.histogram(
+    "openrouter_request_duration_seconds", "Durata delle chiamate a OpenRouter, retry inclusi",
+    ("mode", "outcome"))
+DESCRIPTION_FALLBACKS = metrics.counter(
+    "description_fallbacks", "Descrizioni standard mostrate al posto di quelle generate", ("reason",))
 
 class DescriptionGenerator:
     def __init__(self, use_real_api=True):
         self.use_real_api = use_real_api
         if self.use_real_api:
             self.api_key = st.secrets["openrouter"]["api_key"]
-            self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+            # api_url nei secrets solo per puntare a un server finto (test di carico)
+            self.api_url = st.secrets["openrouter"].get("api_url", OPENROUTER_URL)
     
     def _get_artwork_specific_facts(self, artwork_id):
         facts_map = {
@@ -48,70 +85,92 @@ class DescriptionGenerator:
         }
         return facts_map.get(artwork_id)
     
+    def _build_request(self, prompt):
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        payload = {
+            "model": MODEL,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            **SAMPLING_PARAMS
+        }
+        return headers, payload
+
     def _call_openrouter_api(self, prompt, retries=3):
-        for attempt in range(retries):    
-            try:
-                messages = [
-                    {
-                        "role": "system",
-                        "content": """SEI UNA GUIDA MUSEALE CHE DEVE ESSERE MOLTO CONCISA.
-                        
-    REGOLE DI SCRITTURA:
-    1. SOLO FATTI, NIENTE INTERPRETAZIONI
-    2. NIENTE "invita a", "suggerisce", "esplora", "celebra"
-    3. NIENTE aggettivi descrittivi (ricca, unica, emblematica)
-    4. NIENTE riflessioni filosofiche
-    5. FRASI BREVI E DIRETTE
-    6. SOLO informazioni dall'utente
+        headers, payload = self._build_request(prompt)
+        start = time.perf_counter()
+        try:
+            # Retry, backoff e circuit breaker sono gestiti dal client condiviso
+            response = get_http_client().post_json(self.api_url, headers, payload, retries=retries)
+            result = response.json()
+        except CircuitOpenError:
+            OPENROUTER_SECONDS.observe(time.perf_counter() - start, mode="blocking", outcome="circuit_open")
+            logger.warning("OpenRouter non disponibile: uso della descrizione standard")
+            return None
+        except Exception as e:
+            OPENROUTER_SECONDS.observe(time.perf_counter() - start, mode="blocking", outcome="error")
+            logger.warning("Chiamata a OpenRouter fallita: %s", e)
+            return None
+        OPENROUTER_SECONDS.observe(time.perf_counter() - start, mode="blocking", outcome="ok")
 
-    ESEMPIO DI COME SCRIVI:
-    "Artista, 'Titolo' (anno). Tecnica.
-    Elemento 1. Elemento 2.
-    Significato 1. Significato 2."
+        if "choices" in result and result["choices"]:
+            return result["choices"][0]["message"]["content"]
+        else:
+            return None
 
-    NON AGGIUNGERE NULLA DI TUO."""
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-                
-                response = requests.post(
-                    url=self.api_url,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    data=json.dumps({
-                        "model": "openai/gpt-4o-mini-2024-07-18",
-                        "messages": messages,
-                        "max_tokens": 300,
-                        "temperature": 0.0,  # ZERO creatività
-                        "top_p": 0.1
-                    }),
-                    timeout=30
-                )
-                
-                response.raise_for_status()
-                result = response.json()
-                
-                if "choices" in result and result["choices"]:
-                    return result["choices"][0]["message"]["content"]
-                else:
-                    return None
-                    
-            except Exception as e:
-                if attempt < retries - 1:
-                    time.sleep(1)
+    def _iter_openrouter_stream(self, prompt, retries=3):
+        """Consuma lo stream SSE di chat completions e restituisce i frammenti di testo"""
+        headers, payload = self._build_request(prompt)
+        payload["stream"] = True
+        response = get_http_client().post_json(self.api_url, headers, payload, retries=retries, stream=True)
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                # Le righe che iniziano con ":" sono commenti keep-alive
+                if not line or not line.startswith("data:"):
                     continue
-                return None
-    
-    def get_negative_personalized_description(self, artwork_data):
-        if self.use_real_api:
-            artwork_specific_facts = self._get_artwork_specific_facts(artwork_data['id'])
-            
-            prompt = f"""
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                if choices:
+                    chunk = choices[0].get("delta", {}).get("content")
+                    if chunk:
+                        yield chunk
+
+    def _stream_openrouter_api(self, prompt, on_chunk, retries=3):
+        text = ""
+        start = time.perf_counter()
+        try:
+            for chunk in self._iter_openrouter_stream(prompt, retries=retries):
+                text += chunk
+                on_chunk(text)
+        except CircuitOpenError:
+            OPENROUTER_SECONDS.observe(time.perf_counter() - start, mode="stream", outcome="circuit_open")
+            logger.warning("OpenRouter non disponibile: uso della descrizione standard")
+            return None
+        except Exception as e:
+            # Uno stream interrotto non va in cache: meglio la descrizione standard
+            OPENROUTER_SECONDS.observe(time.perf_counter() - start, mode="stream", outcome="error")
+            logger.warning("Stream da OpenRouter interrotto: %s", e)
+            return None
+        # Durata fino all'ultimo frammento: include il tempo di rendering di on_chunk
+        OPENROUTER_SECONDS.observe(time.perf_counter() - start, mode="stream", outcome="ok")
+        return text or None
+
+    def _build_prompt(self, artwork_data):
+        artwork_specific_facts = self._get_artwork_specific_facts(artwork_data['id'])
+
+        prompt = f"""
 Sei una guida museale. Scrivi una descrizione CONCISA ma COMPLETA.
 
 **REGOLE ASSOLUTE:**
@@ -154,13 +213,55 @@ attribuendo al cedro un valore simbolico che trascende la semplice descrizione n
 
 **Scrivi ora una descrizione completa ma non esplicitamente didattica:**
 """
-            
-            description = self._call_openrouter_api(prompt)
-            
+        return prompt
+
+    def get_prompt_and_hashes(self, artwork_data):
+        prompt = self._build_prompt(artwork_data)
+        prompt_hash = make_cache_key(MODEL, SYSTEM_PROMPT, prompt, SAMPLING_PARAMS)
+        facts_hash = hash_text(self._get_artwork_specific_facts(artwork_data['id']))
+        return prompt, prompt_hash, facts_hash
+
+    def _load_or_generate(self, artwork_data, prompt, prompt_hash, facts_hash, on_chunk=None):
+        # Prima le descrizioni pre-generate, poi la chiamata dal vivo
+        store = get_description_store()
+        if store:
+            try:
+                stored = store.get(artwork_data['id'], prompt_hash)
+                if stored:
+                    return stored['description']
+            except Exception:
+                store = None
+
+        mode = "stream" if on_chunk else "blocking"
+        with tracing.span("llm.generate", {"artwork.id": artwork_data['id'], "llm.mode": mode}) as attributes:
+            if on_chunk:
+                description = self._stream_openrouter_api(prompt, on_chunk)
+            else:
+                description = self._call_openrouter_api(prompt)
+            attributes["llm.outcome"] = "ok" if description else "failed"
+        if description and store:
+            try:
+                store.save(artwork_data['id'], prompt_hash, facts_hash, description.strip(), MODEL)
+            except Exception:
+                pass
+        return description
+
+    def get_negative_personalized_description(self, artwork_data, on_chunk=None):
+        # on_chunk(testo_parziale) viene chiamata mentre arrivano i token, se la descrizione va generata
+        if self.use_real_api:
+            prompt, prompt_hash, facts_hash = self.get_prompt_and_hashes(artwork_data)
+            # Prompt identico e temperature 0: una sola chiamata per tutti i partecipanti
+            description = get_description_cache().get_or_compute(
+                prompt_hash,
+                lambda: self._load_or_generate(artwork_data, prompt, prompt_hash, facts_hash, on_chunk)
+            )
+
             if description:
                 description = description.strip()
                 return description
             else:
+                DESCRIPTION_FALLBACKS.inc(reason="generation_failed")
                 return artwork_data['standard_description']
         else:
+            DESCRIPTION_FALLBACKS.inc(reason="api_disabled")
             return artwork_data['standard_description']
\ No newline at end of file
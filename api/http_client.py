@@ -0,0 +1,166 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from api.prefetch import MAX_WORKERS
+from utils import metrics, tracing
+from utils.cache_lifecycle import process_resource
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+HTTP_RETRIES = metrics.counter("openrouter_http_retries", "Tentativi ripetuti verso OpenRouter")
+HTTP_REJECTED = metrics.counter("openrouter_circuit_rejections", "Chiamate rifiutate a circuito aperto")
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Dopo troppi errori consecutivi blocca le chiamate per un intervallo di tempo"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                # Una sola richiesta di prova decide se richiudere il circuito
+                self.state = "half_open"
+                return True
+            return self.state == "closed"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    # Full jitter: attesa casuale fino al tetto esponenziale
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def parse_retry_after(response):
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class PooledHttpClient:
+    """Sessione HTTP keep-alive condivisa, con retry, backoff e circuit breaker"""
+
+    def __init__(self, pool_size=MAX_WORKERS, breaker=None, sleep=time.sleep):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.adapter = adapter
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+    def _count(self, field):
+        with self._lock:
+            self.stats[field] += 1
+
+    def post_json(self, url, headers, payload, retries=3, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=False):
+        last_error = None
+        for attempt in range(retries):
+            if not self.breaker.allow_request():
+                self._count("rejected")
+                HTTP_REJECTED.inc()
+                raise CircuitOpenError("OpenRouter non disponibile, circuito aperto")
+
+            if attempt > 0:
+                self._count("retries")
+                HTTP_RETRIES.inc()
+            self._count("requests")
+            response = None
+            # Con stream=True lo span del tentativo si chiude all'arrivo delle intestazioni
+            with tracing.span("openrouter.attempt", {"attempt": attempt + 1, "stream": stream}) as attributes:
+                try:
+                    response = self.session.post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+                    attributes["http.status_code"] = response.status_code
+                    if response.status_code in RETRYABLE_STATUS:
+                        raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                    # Anche un 4xx dimostra che OpenRouter risponde: chiude il circuito (e la prova half_open)
+                    self.breaker.record_success()
+                    if response.status_code >= 400:
+                        # Errore del client (chiave, payload): ritentare non serve
+                        self._count("failures")
+                        response.close()
+                        response.raise_for_status()
+                    return response
+                except requests.HTTPError as e:
+                    if e.response is not None and e.response.status_code not in RETRYABLE_STATUS:
+                        raise
+                    last_error = e
+                except RETRYABLE_ERRORS as e:
+                    last_error = e
+                except BaseException:
+                    # URL non valido, redirect infiniti, ecc.: esito registrato comunque,
+                    # altrimenti il circuito resterebbe half_open per sempre
+                    self.breaker.record_failure()
+                    self._count("failures")
+                    raise
+                attributes["error"] = str(last_error)
+
+            if response is not None:
+                # Con stream=True la connessione torna al pool solo chiudendo la risposta
+                response.close()
+            self.breaker.record_failure()
+            if attempt < retries - 1:
+                self._sleep(backoff_delay(attempt, parse_retry_after(response)))
+
+        self._count("failures")
+        raise last_error
+
+    def _connection_pools(self):
+        container = self.adapter.poolmanager.pools
+        with container.lock:
+            return list(container._container.values())
+
+    def get_metrics(self):
+        pools = self._connection_pools()
+        connections = sum(pool.num_connections for pool in pools)
+        pool_requests = sum(pool.num_requests for pool in pools)
+        with self._lock:
+            metrics = dict(self.stats)
+        metrics.update({
+            "connections_opened": connections,
+            "connections_reused": max(0, pool_requests - connections),
+            "breaker_state": self.breaker.state,
+            "breaker_failures": self.breaker.consecutive_failures,
+        })
+        return metrics
+
+
+@process_resource("openrouter_http_client")
+def get_http_client():
+    return PooledHttpClient()
@@ -0,0 +1,29 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils import tracing
+from utils.cache_lifecycle import process_resource
+
+MAX_WORKERS = 8
+
+
+@process_resource("prefetch_executor")
+def get_prefetch_executor():
+    # Condiviso tra le sessioni: limita le chiamate al modello in parallelo
+    return ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="description-prefetch")
+
+
+def submit_description(artwork):
+    from api.description_generator import DescriptionGenerator
+
+    ctx = get_script_run_ctx()
+
+    def task():
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
+        try:
+            return DescriptionGenerator().get_negative_personalized_description(artwork)
+        finally:
+            add_script_run_ctx(thread, None)
+
+    return get_prefetch_executor().submit(tracing.bind_context(task))
@@ -1,15 +1,10 @@
 import streamlit as st
-import os
 import time
+from database.mongo_handler import save_checkpoint
+from utils.assets import inject_css
 
 def render():
-    def load_css():
-        css_path = os.path.join(os.getcwd(), "style.css")
-        if os.path.exists(css_path):
-            with open(css_path) as f:
-                st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-
-    load_css()
+    inject_css()
 
     required_states = ['demographics', 'top_3_interests', 'experimental_group', 'participant_id']
     missing_states = [state for state in required_states if not st.session_state.get(state)]
@@ -19,6 +14,10 @@ def render():
         st.session_state.app_state = "welcome"
         st.rerun()
 
+    # Ordine e gruppo sono già noti: le descrizioni si generano mentre il partecipante legge
+    from database.artwork_data import get_artwork_order_for_database, prefetch_artwork_descriptions
+    prefetch_artwork_descriptions(st.session_state.experimental_group, st.session_state.top_3_interests)
+
     st.progress(100, text="Fase 4 di 4: Visualizzazione opere e test")
 
     st.markdown('<div class="main-title">Visualizzazione Opere d\'Arte</div>', unsafe_allow_html=True)
@@ -36,6 +35,10 @@ def render():
         st.session_state.current_artwork_index = 0
         st.session_state.artwork_start_time = None
         st.session_state.viewing_completed = False
+
+        save_checkpoint(st.session_state.participant_id, "art_viewing", {
+            'artwork_order': get_artwork_order_for_database()
+        })
     
         st.session_state.app_state = "art_viewing"
         
@@ -2,18 +2,16 @@ import streamlit as st
 import time
 import sys
 import os
-import base64
 
 sys.path.append(os.path.dirname(__file__))
 
-def render():
-    def load_css():
-        css_path = os.path.join(os.getcwd(), "style.css")
-        if os.path.exists(css_path):
-            with open(css_path) as f:
-                st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+from database.mongo_handler import save_checkpoint
+from utils.assets import inject_css
+from utils.images import get_image_html
+from utils.tracing import record_span
 
-    load_css()
+def render():
+    inject_css()
     
     from database.artwork_data import get_artwork_by_index, get_artwork_description, initialize_artwork_order
     
@@ -77,27 +75,17 @@ def render():
 
     with col_img:
         try:
-            image_filename = artwork['image_url']
-            possible_paths = [
-                os.path.join("images", image_filename),
-                os.path.join(os.getcwd(), "images", image_filename),
-            ]
-            image_found = False
-            for image_path in possible_paths:
-                if os.path.exists(image_path):
-                    with open(image_path, "rb") as img_file:
-                        img_bytes = img_file.read()
-                        img_base64 = base64.b64encode(img_bytes).decode()
-                    mime_type = "image/jpeg"
-                    st.markdown(f"""
-                    <div style="display: flex; justify-content: center; align-items: center; padding: 20px;">
-                        <img src="data:{mime_type};base64,{img_base64}" 
-                             style="max-width: 700px; max-height: 600px; width: auto; height: auto; object-fit: contain;">
-                    </div>
-                    """, unsafe_allow_html=True)
-                    image_found = True
-                    break
-            if not image_found:
+            image_html = get_image_html(
+                artwork['image_url'],
+                "max-width: 700px; max-height: 600px; width: auto; height: auto; object-fit: contain;"
+            )
+            if image_html:
+                st.markdown(f"""
+                <div style="display: flex; justify-content: center; align-items: center; padding: 20px;">
+                    {image_html}
+                </div>
+                """, unsafe_allow_html=True)
+            else:
                 st.error(f"Immagine non trovata: {artwork['image_url']}")
         except Exception as e:
             st.error(f"Errore nel caricamento dell'immagine: {e}")
@@ -105,18 +93,25 @@ def render():
     with col_desc:
         st.markdown(f"**Artista:** {artwork['artist']} | **Anno:** {artwork['year']} | **Stile:** {artwork['style']}")
         
+        st.markdown("### Descrizione dell'opera")
+        description_box = st.empty()
+
+        # Se la descrizione va generata ora, il testo compare man mano che arrivano i token
+        def show_partial(text):
+            description_box.markdown(f'<div class="description-box">{text}</div>', unsafe_allow_html=True)
+
         description, selected_interest = get_artwork_description(
             artwork,
             st.session_state.experimental_group,
-            st.session_state.top_3_interests
+            st.session_state.top_3_interests,
+            on_chunk=show_partial
         )
         
         if 'artwork_interests' not in st.session_state:
             st.session_state.artwork_interests = {}
         st.session_state.artwork_interests[artwork['id']] = selected_interest
         
-        st.markdown("### Descrizione dell'opera")
-        st.markdown(f'<div class="description-box">{description}</div>', unsafe_allow_html=True)
+        show_partial(description)
 
     st.markdown("---")
 
@@ -128,7 +123,12 @@ def render():
             
         st.session_state.button_clicked = True
         
-        viewing_time_seconds = time.time() - st.session_state[f"start_time_{current_idx}"]
+        viewed_at = time.time()
+        viewing_time_seconds = viewed_at - st.session_state[f"start_time_{current_idx}"]
+        record_span("artwork.view", st.session_state[f"start_time_{current_idx}"], viewed_at, {
+            "artwork.id": artwork['id'],
+            "artwork.index": current_idx,
+        })
         
         minutes = int(viewing_time_seconds // 60)
         seconds = int(viewing_time_seconds % 60)
@@ -148,6 +148,10 @@ def render():
         })
         st.session_state.artwork_viewing_times[artwork['id']] = viewing_time_formatted,
         
+        save_checkpoint(st.session_state.participant_id, f"artwork_{current_idx + 1}", {
+            'artwork_viewing_times': st.session_state.artwork_viewing_times
+        })
+        
         st.session_state.current_artwork += 1
         st.session_state.button_clicked = False
         
@@ -0,0 +1,61 @@
+"""Throughput e collisioni del generatore di participant_id.
+
+Uso:
+    python -m benchmarks.bench_participant_id --threads 8 --per-thread 200000 --min-rate 100000
+
+Esce con codice 1 se trova collisioni, id non crescenti in un thread o un throughput sotto --min-rate.
+"""
+import argparse
+import sys
+import threading
+import time
+
+from database.participant_id import new_participant_id
+
+
+def run(threads, per_thread):
+    results = [None] * threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(slot):
+        barrier.wait()
+        results[slot] = [new_participant_id() for _ in range(per_thread)]
+
+    workers = [threading.Thread(target=worker, args=(slot,)) for slot in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_ids = [pid for ids in results for pid in ids]
+    return {
+        "ids": len(all_ids),
+        "elapsed": elapsed,
+        "rate": len(all_ids) / elapsed,
+        "collisions": len(all_ids) - len(set(all_ids)),
+        "non_monotonic_threads": sum(1 for ids in results if ids != sorted(ids)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del generatore di participant_id")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--per-thread", type=int, default=200_000)
+    parser.add_argument("--min-rate", type=float, default=100_000, help="id al secondo richiesti")
+    args = parser.parse_args(argv)
+
+    report = run(args.threads, args.per_thread)
+    print(f"id generati: {report['ids']} in {report['elapsed']:.2f}s con {args.threads} thread")
+    print(f"throughput: {report['rate']:,.0f} id/s")
+    print(f"collisioni: {report['collisions']}")
+    print(f"thread con id non crescenti: {report['non_monotonic_threads']}")
+
+    ok = report["collisions"] == 0 and report["non_monotonic_threads"] == 0 and report["rate"] >= args.min_rate
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
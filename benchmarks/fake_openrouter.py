@@ -0,0 +1,155 @@
+"""Server locale che imita l'endpoint chat/completions di OpenRouter, con latenze ed errori iniettabili.
+
+Uso da solo (per provare l'app a mano con api_url = "http://127.0.0.1:8765/api/v1/chat/completions"):
+    python -m benchmarks.fake_openrouter --port 8765 --latency-ms 800 --error-rate 0.05
+
+La latenza del primo byte segue una lognormale (mediana latency_ms, dispersione latency_sigma);
+con stream=True il testo arriva in chunk SSE distanziati di chunk_interval_ms.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PATH = "/api/v1/chat/completions"
+FAKE_TEXT = (
+    "Descrizione generata dal server finto per il test di carico. "
+    "Contiene abbastanza parole da produrre diversi frammenti in streaming, "
+    "come farebbe il modello vero con una risposta breve e fattuale."
+)
+
+
+class FaultProfile:
+    """Distribuzioni di latenza ed errori del server finto"""
+
+    def __init__(self, latency_ms=800.0, latency_sigma=0.5, error_rate=0.0, error_status=503,
+                 retry_after=None, chunk_interval_ms=20.0, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.chunk_interval_ms = chunk_interval_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def first_byte_delay(self):
+        if self.latency_ms <= 0:
+            return 0.0
+        with self._lock:
+            return self._random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server.count("requests")
+
+        if self.path != PATH:
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        time.sleep(server.profile.first_byte_delay())
+        if server.profile.should_fail():
+            server.count("errors")
+            headers = {"Retry-After": str(server.profile.retry_after)} if server.profile.retry_after else {}
+            self._send_json(server.profile.error_status, {"error": {"message": "errore iniettato"}}, headers)
+            return
+
+        if body.get("stream"):
+            self._send_stream(server.profile.chunk_interval_ms / 1000)
+        else:
+            self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": FAKE_TEXT}}]})
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, interval):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(b": OPENROUTER PROCESSING\n\n")
+        for word in FAKE_TEXT.split(" "):
+            event = {"choices": [{"delta": {"content": word + " "}}]}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+            if interval:
+                time.sleep(interval)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+
+class FakeOpenRouter(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, profile=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.profile = profile or FaultProfile()
+        self.counters = {"requests": 0, "errors": 0}
+        self._counter_lock = threading.Lock()
+        self._thread = None
+
+    def count(self, name):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{PATH}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-openrouter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Server OpenRouter finto")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--chunk-interval-ms", type=float, default=20)
+    args = parser.parse_args(argv)
+
+    profile = FaultProfile(args.latency_ms, args.latency_sigma, args.error_rate, args.error_status,
+                           chunk_interval_ms=args.chunk_interval_ms)
+    server = FakeOpenRouter(profile, port=args.port)
+    print(f"OpenRouter finto in ascolto su {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""Test di carico: molti partecipanti simulati percorrono tutto main_app.py in parallelo.
+
+Uso:
+    python -m benchmarks.load_test --sessions 200 --concurrency 50
+    python -m benchmarks.load_test --sessions 100 --concurrency 25 --llm-latency-ms 1500 --llm-error-rate 0.1 --out report.json
+
+Ogni partecipante è una sessione AppTest (Streamlit >= 1.30) che attraversa
+welcome -> interests -> art_warning -> art_viewing -> recall come farebbe il browser.
+Tutte le sessioni girano nello stesso processo, come su un server vero: condividono cache,
+client HTTP, pool Mongo e thread di flush. OpenRouter è sostituito da benchmarks.fake_openrouter,
+MongoDB da mongomock (mode = "memory"); journal e stato di sessione finiscono in una cartella temporanea.
+Dipendenze in più rispetto all'app: pip install -r requirements-dev.txt
+
+Il report riporta p50/p95/p99 per rerun e per fase, il throughput e la crescita della RSS per sessione.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from unittest.mock import MagicMock
+from urllib import parse
+
+import numpy as np
+import streamlit as st
+from streamlit.proto.WidgetStates_pb2 import WidgetStates
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.element_tree import get_widget_state
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+from benchmarks.fake_openrouter import FakeOpenRouter, FaultProfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "main_app.py")
+PERCENTILES = (50, 95, 99)
+RSS_SAMPLE_INTERVAL = 0.5
+
+
+class ConcurrentAppTest(AppTest):
+    """AppTest che non tocca lo stato globale a ogni run.
+
+    AppTest._run sostituisce e poi ripristina Runtime._instance e st.secrets: con più sessioni
+    in parallelo una teardown toglierebbe il runtime a uno script ancora in esecuzione.
+    Qui runtime finto e secrets sono installati una volta sola da install_shared_runtime().
+    """
+
+    def _run(self, widget_state=None, timeout=None):
+        runner = LocalScriptRunner(self._script_path, self.session_state, args=self.args, kwargs=self.kwargs)
+        self._tree = runner.run(widget_state, self.query_params, timeout or self.default_timeout)
+        self._tree._runner = self
+        query_string = runner.event_data[-1]["client_state"].query_string
+        self.query_params = parse.parse_qs(query_string)
+        return self
+
+    def submit(self, timeout=None):
+        """Come ElementTree.run(), ma ignora i widget di un run interrotto da st.rerun().
+
+        Il widget c'è ancora nell'albero, ma il suo stato è già stato rimosso dalla sessione.
+        """
+        states = WidgetStates()
+        for node in self._tree:
+            try:
+                state = get_widget_state(node)
+            except KeyError:
+                continue
+            if state is not None:
+                states.widgets.append(state)
+        return self._run(states, timeout)
+
+
+def install_shared_runtime(secrets):
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    shared_secrets = Secrets([])
+    shared_secrets._secrets = secrets
+    st.secrets = shared_secrets
+
+
+def build_secrets(llm_url, work_dir):
+    return {
+        "openrouter": {"api_key": "load-test", "api_url": llm_url},
+        "mongodb": {"mode": "memory", "database_name": "load_test"},
+        "write_behind": {"journal_path": os.path.join(work_dir, "participants_journal.db")},
+        "session_store": {"backend": "sqlite", "path": os.path.join(work_dir, "sessions.db")},
+    }
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # Su macOS/BSD non c'è /proc: si ripiega sul massimo (in KB su Linux, byte su macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class RSSSampler:
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class Participant:
+    """Un partecipante simulato; registra la durata di ogni rerun con la fase in cui è partito"""
+
+    def __init__(self, rng, think_time=0.0, timeout=60):
+        self.rng = rng
+        self.think_time = think_time
+        self.at = ConcurrentAppTest(APP_PATH, default_timeout=timeout)
+        self.reruns = []
+
+    def _phase(self):
+        try:
+            return self.at.session_state["app_state"]
+        except KeyError:
+            return "welcome"
+
+    def _timed(self, action):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, 2 * self.think_time))
+        phase = self._phase()
+        start = time.perf_counter()
+        action()
+        self.reruns.append((phase, time.perf_counter() - start))
+        if self.at.exception:
+            raise RuntimeError(f"eccezione nell'app durante {phase}: {self.at.exception[0].value}")
+
+    def _button(self, text):
+        for button in self.at.button:
+            if text in button.label:
+                return button
+        raise LookupError(f"pulsante \"{text}\" non trovato in fase {self._phase()}")
+
+    def click(self, text):
+        self._timed(lambda: (self._button(text).click(), self.at.submit()))
+
+    def run(self):
+        at = self.at
+        self._timed(at.run)
+
+        # Consenso e dati demografici
+        at.checkbox(key="consenso_checkbox").check()
+        self._timed(at.submit)
+        self.click("Procedi alle Informazioni Demografiche")
+        at.number_input[0].set_value(self.rng.randint(18, 80))
+        for selectbox in at.selectbox:
+            selectbox.set_value(self.rng.choice(selectbox.options[1:]))
+        self.click("Procedi alla Sezione Interessi")
+
+        # Interessi
+        for slider in at.slider:
+            slider.set_value(self.rng.randint(1, 5))
+        self.click("Profilo Completato")
+        self.click("Procedi alla Visualizzazione delle Opere")
+
+        # Opere
+        self.click("Inizia la Visualizzazione delle Opere")
+        while self._phase() == "art_viewing":
+            label = "Procedi all'opera successiva" if any("successiva" in b.label for b in at.button) else "Completa visualizzazione opere"
+            self.click(label)
+
+        # Test di memoria e feedback
+        self.click("Inizia il Test")
+        while any("Salva e Procedi" in b.label for b in at.button):
+            for radio in at.radio:
+                radio.set_value(self.rng.choice(radio.options))
+            self.click("Salva e Procedi")
+        self.click("Vedi i Miei Risultati")
+        at.text_area[0].input("Feedback del test di carico")
+        self.click("Invia Feedback e Completa Studio")
+        self.click("Termina Studio")
+        return self.reruns
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    array = np.asarray(values) * 1000
+    summary = {"count": len(values)}
+    for p, value in zip(PERCENTILES, np.percentile(array, PERCENTILES)):
+        summary[f"p{p}_ms"] = round(float(value), 1)
+    summary["max_ms"] = round(float(array.max()), 1)
+    return summary
+
+
+def run_session(seed, think_time, timeout):
+    participant = Participant(random.Random(seed), think_time, timeout)
+    start = time.perf_counter()
+    try:
+        participant.run()
+        return True, participant.reruns, time.perf_counter() - start, None
+    except Exception as e:
+        return False, participant.reruns, time.perf_counter() - start, f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=3)}"
+
+
+def run_load_test(sessions, concurrency, profile, think_time=0.0, ramp_up=0.0, warmup=1, timeout=60, seed=0):
+    work_dir = tempfile.mkdtemp(prefix="load_test_")
+    server = FakeOpenRouter(profile).start()
+    install_shared_runtime(build_secrets(server.url, work_dir))
+
+    # Le prime sessioni pagano import, compilazione e cache vuote: non entrano nelle misure
+    for i in range(warmup):
+        run_session(seed - 1 - i, 0.0, timeout)
+    server.counters.update(requests=0, errors=0)
+
+    rss_start = current_rss()
+    results = []
+    with RSSSampler() as sampler, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        futures = []
+        for i in range(sessions):
+            if ramp_up and i < concurrency:
+                time.sleep(ramp_up / concurrency)
+            futures.append(executor.submit(run_session, seed + i, think_time, timeout))
+        for future in as_completed(futures):
+            results.append(future.result())
+        elapsed = time.perf_counter() - start
+    rss_end = current_rss()
+    server.stop()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    completed = [r for r in results if r[0]]
+    all_reruns = [rerun for r in results for rerun in r[1]]
+    by_phase, phase_totals = {}, {}
+    for _, reruns, _, _ in results:
+        totals = {}
+        for phase, seconds in reruns:
+            by_phase.setdefault(phase, []).append(seconds)
+            totals[phase] = totals.get(phase, 0.0) + seconds
+        for phase, seconds in totals.items():
+            phase_totals.setdefault(phase, []).append(seconds)
+
+    return {
+        "config": {
+            "sessions": sessions,
+            "concurrency": concurrency,
+            "think_time_s": think_time,
+            "llm_latency_ms": profile.latency_ms,
+            "llm_latency_sigma": profile.latency_sigma,
+            "llm_error_rate": profile.error_rate,
+            "llm_error_status": profile.error_status,
+        },
+        "sessions": {
+            "completed": len(completed),
+            "failed": len(results) - len(completed),
+            "errors": [r[3] for r in results if not r[0]][:5],
+        },
+        "elapsed_s": round(elapsed, 2),
+        "throughput": {
+            "sessions_per_s": round(len(completed) / elapsed, 3),
+            "reruns_per_s": round(len(all_reruns) / elapsed, 2),
+        },
+        "rerun_latency": {"all": summarize([s for _, s in all_reruns]), **{p: summarize(v) for p, v in by_phase.items()}},
+        "phase_duration": {p: summarize(v) for p, v in phase_totals.items()},
+        "session_duration": summarize([r[2] for r in completed]),
+        "rss_mb": {
+            "start": round(rss_start / 2**20, 1),
+            "end": round(rss_end / 2**20, 1),
+            "peak": round(max(sampler.peak, rss_end) / 2**20, 1),
+            "growth_per_session_kb": round((rss_end - rss_start) / max(len(results), 1) / 1024, 1),
+        },
+        "fake_openrouter": dict(server.counters),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test di carico dell'app con partecipanti simulati")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--think-time", type=float, default=0.0, help="pausa media (s) tra un'azione e l'altra")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="secondi per avviare tutte le sessioni concorrenti")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="sessioni non misurate; con 0 le descrizioni non sono ancora nello store")
+    parser.add_argument("--timeout", type=float, default=60, help="timeout di un singolo rerun")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.5)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-error-status", type=int, default=503)
+    parser.add_argument("--llm-chunk-interval-ms", type=float, default=20)
+    parser.add_argument("--out", help="scrive il report JSON anche su file")
+    args = parser.parse_args(argv)
+
+    profile = FaultProfile(args.llm_latency_ms, args.llm_latency_sigma, args.llm_error_rate,
+                           args.llm_error_status, chunk_interval_ms=args.llm_chunk_interval_ms, seed=args.seed)
+    report = run_load_test(args.sessions, args.concurrency, profile, args.think_time, args.ramp_up,
+                           args.warmup, args.timeout, args.seed)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    return 0 if report["sessions"]["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""Microbenchmark dei percorsi caldi, confrontati con baseline salvate in JSON.
+
+Uso:
+    python -m benchmarks.microbench                     # confronta con benchmarks/baselines.json
+    python -m benchmarks.microbench --update-baseline   # riscrive le baseline (sulla macchina di riferimento)
+    python -m benchmarks.microbench --only prompt --only image
+
+Per ogni benchmark si prende il minimo del tempo medio per chiamata su più ripetizioni e su più
+processi: è la stima meno sensibile al rumore. Esce con codice 1 se un benchmark supera
+baseline x soglia anche dopo una seconda misura. Le baseline dipendono dalla macchina: vanno
+rigenerate quando cambia l'ambiente di riferimento.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import streamlit as st
+
+from benchmarks.fake_openrouter import FakeOpenRouter, FaultProfile
+from benchmarks.load_test import APP_PATH, ROOT, ConcurrentAppTest, build_secrets, install_shared_runtime
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_THRESHOLD = 1.5
+# I render completi passano da thread, protobuf e I/O: più rumorosi delle funzioni pure
+RENDER_THRESHOLD = 1.75
+REPEATS = 7
+MIN_REPEAT_SECONDS = 0.1
+PROCESSES = 5
+
+
+class _SessionState(dict):
+    """Sostituto di st.session_state per chiamare le funzioni fuori da uno script Streamlit"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+PARTICIPANT_STATE = {
+    "demographics": {"age": 30, "gender": "Femmina", "education": "Diploma",
+                     "art_familiarity": "Nessuna esperienza", "museum_visits": "Mai"},
+    "interest_ratings": {"Sport": 5, "Musica": 4, "Viaggi": 3},
+    "top_3_interests": ["Sport", "Musica", "Viaggi"],
+    "experimental_group": "C",
+    "participant_id": "P_BENCH",
+    "interests_time_spent": 12.0,
+    "profile_completed": True,
+}
+
+
+def measure(func, repeats=REPEATS, min_seconds=MIN_REPEAT_SECONDS):
+    """Secondi per chiamata: minimo tra le ripetizioni, ciascuna lunga almeno min_seconds.
+
+    Come timeit, il garbage collector è spento durante la misura: le sue pause dipendono da
+    quanti oggetti ha il processo, non dalla funzione misurata.
+    """
+    func()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _measure(func, repeats, min_seconds)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _measure(func, repeats, min_seconds):
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            break
+        loops *= 2 if elapsed == 0 else max(2, int(min_seconds / elapsed) + 1)
+    best = elapsed / loops
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+
+@contextlib.contextmanager
+def bench_prompt():
+    from api.description_generator import DescriptionGenerator
+    from database.artwork_data import ARTWORKS
+
+    generator = DescriptionGenerator(use_real_api=False)
+    artwork = ARTWORKS[0]
+    yield {
+        "prompt.build": lambda: generator._build_prompt(artwork),
+        "prompt.build_and_hash": lambda: generator.get_prompt_and_hashes(artwork),
+    }
+
+
+@contextlib.contextmanager
+def bench_session_paths():
+    from database import artwork_data
+
+    state = _SessionState(PARTICIPANT_STATE)
+    artwork = artwork_data.ARTWORKS[0]
+    group, interests = state["experimental_group"], state["top_3_interests"]
+
+    def order():
+        state.pop("artwork_order", None)
+        artwork_data.initialize_artwork_order()
+
+    def by_index():
+        for index in range(len(artwork_data.ARTWORKS)):
+            artwork_data.get_artwork_by_index(index)
+
+    # Le funzioni leggono st.session_state a ogni chiamata: la patch resta attiva durante la misura
+    with mock.patch.object(st, "session_state", state):
+        artwork_data._save_cached_description(artwork, group, interests, "Descrizione in cache.", None)
+        yield {
+            "artwork.description_cache_hit": lambda: artwork_data.get_artwork_description(artwork, group, interests),
+            "artwork.initialize_order": order,
+            "artwork.get_by_index": by_index,
+        }
+
+
+@contextlib.contextmanager
+def bench_recall_scoring():
+    from database.recall_questions import get_question_bank, score_answers
+
+    question_bank = get_question_bank()
+    question_sets = [question_bank.get(artwork_id) for artwork_id in question_bank.order]
+    answers = [[i % len(q.options) for i, q in enumerate(qs.questions)] for qs in question_sets]
+
+    def score_all():
+        for question_set, answer_indexes in zip(question_sets, answers):
+            score_answers(question_set, answer_indexes)
+
+    yield {"recall.score_answers": score_all}
+
+
+@contextlib.contextmanager
+def bench_participant_id():
+    from database.mongo_handler import generate_participant_id
+    yield {"participant_id.generate": generate_participant_id}
+
+
+@contextlib.contextmanager
+def bench_image():
+    from utils import images
+
+    filename = "10661-17csont.jpg"
+    style = "max-width: 700px; max-height: 600px; width: auto; height: auto; object-fit: contain;"
+
+    def cold_data_uri():
+        # Lettura dal disco e codifica base64, come al primo accesso del processo
+        images._entries.clear()
+        images.get_image_data_uri(filename)
+
+    yield {
+        "image.data_uri_cold": cold_data_uri,
+        "image.data_uri_warm": lambda: images.get_image_data_uri(filename),
+        "image.html": lambda: images.get_image_html(filename, style),
+    }
+
+
+@contextlib.contextmanager
+def bench_page_renders():
+    """Render completo di ogni pagina con AppTest, OpenRouter finto (senza latenza) e Mongo in memoria"""
+    server = FakeOpenRouter(FaultProfile(latency_ms=0, chunk_interval_ms=0)).start()
+    install_shared_runtime(build_secrets(server.url, tempfile.mkdtemp(prefix="microbench_")))
+
+    def page(app_state, **extra):
+        def render():
+            at = ConcurrentAppTest(APP_PATH, default_timeout=30)
+            at.session_state["app_state"] = app_state
+            for key, value in extra.items():
+                at.session_state[key] = value
+            at.run()
+            if at.exception:
+                raise RuntimeError(f"{app_state}: {at.exception[0].value}")
+        return render
+
+    viewing = dict(PARTICIPANT_STATE, current_artwork=0)
+    try:
+        yield {
+            "render.welcome": page("welcome"),
+            "render.demographics": page("welcome", consent_given=True),
+            "render.interests": page("interests", demographics=PARTICIPANT_STATE["demographics"]),
+            "render.art_warning": page("art_warning", **PARTICIPANT_STATE),
+            "render.art_viewing": page("art_viewing", **viewing),
+            "render.recall": page("recall", **PARTICIPANT_STATE, viewing_completed=True),
+        }
+    finally:
+        server.stop()
+
+
+SUITES = {
+    "prompt": bench_prompt,
+    "artwork": bench_session_paths,
+    "recall": bench_recall_scoring,
+    "participant_id": bench_participant_id,
+    "image": bench_image,
+    "render": bench_page_renders,
+}
+
+
+def run_suite(name):
+    with SUITES[name]() as benchmarks:
+        return {bench_name: measure(func) for bench_name, func in benchmarks.items()}
+
+
+def run_in_processes(names, processes=PROCESSES):
+    """Minimo per benchmark su più processi nuovi.
+
+    La velocità di uno stesso benchmark cambia tra un processo e l'altro (layout della memoria,
+    core assegnato) molto più che tra ripetizioni nello stesso processo.
+    """
+    command = [sys.executable, "-m", "benchmarks.microbench", "--worker"]
+    for name in names:
+        command += ["--only", name]
+    results = {}
+    for _ in range(processes):
+        output = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        for name, seconds in json.loads(output.splitlines()[-1]).items():
+            results[name] = min(seconds, results.get(name, seconds))
+    return results
+
+
+def load_baselines(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"threshold": DEFAULT_THRESHOLD, "benchmarks": {}}
+
+
+def compare(results, baselines, threshold=None):
+    """Righe (nome, attuale, baseline, rapporto, soglia, regressione)"""
+    rows = []
+    for name, seconds in results.items():
+        baseline = baselines["benchmarks"].get(name)
+        limit = threshold or (RENDER_THRESHOLD if name.startswith("render.") else baselines.get("threshold", DEFAULT_THRESHOLD))
+        ratio = seconds / baseline if baseline else None
+        rows.append((name, seconds, baseline, ratio, limit, ratio is not None and ratio > limit))
+    return rows
+
+
+def _format_time(seconds):
+    if seconds is None:
+        return "-"
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmark con baseline e soglia di regressione")
+    parser.add_argument("--only", action="append", choices=sorted(SUITES), help="esegue solo queste suite")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, help="rapporto massimo attuale/baseline (sovrascrive quelli salvati)")
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="processi su cui prendere il minimo")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    names = args.only or list(SUITES)
+
+    if args.worker:
+        results = {}
+        for name in names:
+            results.update(run_suite(name))
+        print(json.dumps(results))
+        return 0
+
+    results = run_in_processes(names, args.processes)
+    baselines = load_baselines(args.baseline)
+
+    if args.update_baseline:
+        baselines.setdefault("threshold", DEFAULT_THRESHOLD)
+        baselines["benchmarks"].update({name: round(seconds, 9) for name, seconds in results.items()})
+        baselines["benchmarks"] = dict(sorted(baselines["benchmarks"].items()))
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2)
+            f.write("\n")
+        print(f"Baseline aggiornate in {args.baseline}")
+    else:
+        # Prima di segnalare una regressione la suite si rimisura: un picco di rumore non basta
+        suspects = {name for name, *_, regressed in compare(results, baselines, args.threshold) if regressed}
+        suites = [suite for suite in names if any(name.startswith(f"{suite}.") for name in suspects)]
+        if suites:
+            for name, seconds in run_in_processes(suites, args.processes).items():
+                results[name] = min(seconds, results[name])
+
+    regressions = 0
+    print(f"{'benchmark':36} {'attuale':>12} {'baseline':>12} {'rapporto':>9}")
+    for name, seconds, baseline, ratio, limit, regressed in compare(results, baselines, args.threshold):
+        flag = f"  REGRESSIONE (> x{limit})" if regressed and not args.update_baseline else ""
+        ratio_text = f"x{ratio:.2f}" if ratio is not None else "nuovo"
+        print(f"{name:36} {_format_time(seconds):>12} {_format_time(baseline):>12} {ratio_text:>9}{flag}")
+        regressions += bool(flag)
+
+    if regressions:
+        print(f"{regressions} benchmark più lenti della soglia")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
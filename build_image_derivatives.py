@@ -0,0 +1,176 @@
+"""Genera le varianti ridimensionate delle immagini delle opere (JPEG progressivo e WebP).
+
+Uso:
+    python build_image_derivatives.py
+    python build_image_derivatives.py --workers 4 --force
+
+Le varianti vengono scritte in static/artworks con un hash del contenuto nel nome,
+insieme a manifest.json che il viewer usa per costruire srcset/sizes.
+Le immagini il cui contenuto non è cambiato dall'ultima esecuzione vengono saltate.
+Una variante non più piccola dell'originale non viene servita: alla larghezza piena, se il
+formato è lo stesso, al suo posto va una copia dell'originale, altrimenti è scartata.
+A fine esecuzione si cancellano le varianti che il manifest non cita più.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from database.artwork_data import ARTWORKS
+from utils.images import IMAGES_DIR, MANIFEST_PATH, STATIC_DIR
+
+WIDTHS = [320, 480, 700, 1024, 1400]
+# Da incrementare quando cambia il modo di produrre le varianti: le voci più vecchie si rigenerano
+BUILD_VERSION = 2
+VARIANT_NAME = re.compile(r"^.+-\d+w-[0-9a-f]{10}\.(jpg|webp)$")
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+FORMATS = {
+    "jpeg": {"ext": "jpg", "save": {"format": "JPEG", "quality": JPEG_QUALITY, "optimize": True, "progressive": True}},
+    "webp": {"ext": "webp", "save": {"format": "WEBP", "quality": WEBP_QUALITY, "method": 6}},
+}
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_up_to_date(entry, source_hash):
+    if not entry or entry.get("source_hash") != source_hash or entry.get("build_version") != BUILD_VERSION:
+        return False
+    variants = [v for fmt in entry["variants"].values() for v in fmt]
+    return all(os.path.exists(os.path.join(STATIC_DIR, v["file"])) for v in variants)
+
+
+def build_derivatives(filename):
+    """Eseguita in un processo separato: ridimensiona e codifica una singola immagine"""
+    source_path = os.path.join(IMAGES_DIR, filename)
+    source_hash = file_hash(source_path)
+    source_bytes = os.path.getsize(source_path)
+    stem = os.path.splitext(filename)[0]
+
+    with Image.open(source_path) as original:
+        source_format = original.format
+        image = original.convert("RGB")
+
+    # Non si ingrandisce mai: l'originale fa da variante più larga
+    widths = [w for w in WIDTHS if w < image.width] + [image.width]
+    variants = {name: [] for name in FORMATS}
+
+    for width in widths:
+        height = round(image.height * width / image.width)
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for name, spec in FORMATS.items():
+            tmp_path = os.path.join(STATIC_DIR, f".{stem}-{width}w.{spec['ext']}.{os.getpid()}.tmp")
+            resized.save(tmp_path, **spec["save"])
+            if os.path.getsize(tmp_path) >= source_bytes:
+                # La ricodifica non fa risparmiare nulla (es. un JPEG già ben compresso)
+                if width == image.width and spec["save"]["format"] == source_format:
+                    shutil.copyfile(source_path, tmp_path)
+                else:
+                    os.remove(tmp_path)
+                    continue
+            content_hash = file_hash(tmp_path)[:10]
+            output_name = f"{stem}-{width}w-{content_hash}.{spec['ext']}"
+            os.replace(tmp_path, os.path.join(STATIC_DIR, output_name))
+            variants[name].append({
+                "width": width,
+                "height": height,
+                "file": output_name,
+                "hash": content_hash,
+                "bytes": os.path.getsize(os.path.join(STATIC_DIR, output_name)),
+            })
+
+    return filename, {
+        "build_version": BUILD_VERSION,
+        "source_hash": source_hash,
+        "source_bytes": source_bytes,
+        "width": image.width,
+        "height": image.height,
+        "variants": variants,
+    }
+
+
+def prune_stale(manifest):
+    """Cancella le varianti non più citate dal manifest (sorgenti cambiate o rimosse)"""
+    referenced = {v["file"] for entry in manifest.values() for fmt in entry["variants"].values() for v in fmt}
+    removed = []
+    for name in os.listdir(STATIC_DIR):
+        if VARIANT_NAME.match(name) and name not in referenced:
+            os.remove(os.path.join(STATIC_DIR, name))
+            removed.append(name)
+    return removed
+
+
+def build_all(filenames, workers=None, force=False):
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    manifest = load_manifest()
+    pending = [f for f in filenames if force or not is_up_to_date(manifest.get(f), file_hash(os.path.join(IMAGES_DIR, f)))]
+    # Opere tolte da ARTWORKS: le loro varianti vanno cancellate insieme alla voce
+    stale_entries = [f for f in manifest if f not in filenames]
+
+    if pending or stale_entries:
+        for filename in stale_entries:
+            del manifest[filename]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for filename, entry in executor.map(build_derivatives, pending):
+                manifest[filename] = entry
+
+        tmp_path = f"{MANIFEST_PATH}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, MANIFEST_PATH)
+
+    return manifest, pending, prune_stale(manifest)
+
+
+def bytes_saved_report(manifest, filenames, display_width=700):
+    """Byte risparmiati per opera servendo la variante adatta alla larghezza di visualizzazione"""
+    rows = []
+    for filename in filenames:
+        entry = manifest[filename]
+        row = {"artwork": filename, "original": entry["source_bytes"]}
+        for name, variants in entry["variants"].items():
+            # Senza varianti utili in un formato il browser riceve l'originale
+            chosen = next((v for v in variants if v["width"] >= display_width), variants[-1] if variants else None)
+            row[name] = chosen["bytes"] if chosen else entry["source_bytes"]
+            row[f"{name}_saved"] = entry["source_bytes"] - row[name]
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generazione delle varianti delle immagini delle opere")
+    parser.add_argument("--workers", type=int, default=None, help="numero di processi (default: CPU disponibili)")
+    parser.add_argument("--force", action="store_true", help="rigenera anche le immagini invariate")
+    args = parser.parse_args(argv)
+
+    filenames = sorted({artwork["image_url"] for artwork in ARTWORKS})
+    manifest, built, removed = build_all(filenames, workers=args.workers, force=args.force)
+    print(f"Immagini elaborate: {len(built)}, invariate: {len(filenames) - len(built)}, "
+          f"varianti obsolete cancellate: {len(removed)}")
+
+    print(f"{'opera':<22}{'originale':>12}{'jpeg 700w':>12}{'risparmio':>12}{'webp 700w':>12}{'risparmio':>12}")
+    for row in bytes_saved_report(manifest, filenames):
+        print(f"{row['artwork']:<22}{row['original']:>12}{row['jpeg']:>12}{row['jpeg_saved']:>12}"
+              f"{row['webp']:>12}{row['webp_saved']:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Indici della collezione participants e statistiche dello studio calcolate lato server."""
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReadPreference
+
+PARTICIPANT_INDEXES = [
+    IndexModel([("participant_id", ASCENDING)], unique=True, name="participant_id_unique"),
+    IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)], name="created_at"),
+    IndexModel([("flushed_at", ASCENDING), ("_id", ASCENDING)], name="flushed_at"),
+    IndexModel([("study_completed", ASCENDING), ("experimental_group", ASCENDING)], name="completed_by_group"),
+    IndexModel([("experimental_group", ASCENDING), ("recall_test.total_recall_score", DESCENDING)], name="group_score"),
+    IndexModel([("artwork_order.artwork_ids", ASCENDING)], name="artwork_order"),
+]
+
+VIEWING_TIME_BUCKETS = [0, 30, 60, 90, 120, 180, 300, 600]
+
+
+def ensure_indexes(collection):
+    """Crea gli indici mancanti; se esistono già con la stessa definizione non fa nulla"""
+    return collection.create_indexes(PARTICIPANT_INDEXES)
+
+
+def analytics_collection(collection):
+    # Le letture di analisi vanno sui secondari, per non pesare sul primario che riceve i salvataggi
+    return collection.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+
+
+def _completed(group=None):
+    match = {"study_completed": True}
+    if group:
+        match["experimental_group"] = group
+    return {"$match": match}
+
+
+def _unwind_recall_answers():
+    # recall_answers è un oggetto con chiave = id dell'opera (contiene punti): si passa da $objectToArray
+    return [
+        {"$project": {
+            "experimental_group": 1,
+            "answers": {"$objectToArray": "$recall_test.recall_answers"},
+        }},
+        {"$unwind": "$answers"},
+    ]
+
+
+def group_recall_means_pipeline():
+    return [
+        _completed(),
+        {"$project": {
+            "experimental_group": 1,
+            "score": "$recall_test.total_recall_score",
+            "total": "$recall_test.total_recall_questions",
+        }},
+        {"$group": {
+            "_id": "$experimental_group",
+            "participants": {"$sum": 1},
+            "mean_score": {"$avg": "$score"},
+            "std_score": {"$stdDevSamp": "$score"},
+            "mean_accuracy": {"$avg": {"$divide": ["$score", {"$max": ["$total", 1]}]}},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def artwork_recall_means_pipeline(group=None):
+    return [
+        _completed(group),
+        *_unwind_recall_answers(),
+        {"$group": {
+            "_id": {"artwork_id": "$answers.k", "experimental_group": "$experimental_group"},
+            "participants": {"$sum": 1},
+            "mean_score": {"$avg": "$answers.v.recall_score"},
+            "mean_accuracy": {"$avg": {"$divide": [
+                "$answers.v.recall_score", {"$max": ["$answers.v.total_recall_questions", 1]}
+            ]}},
+        }},
+        {"$sort": {"_id.artwork_id": 1, "_id.experimental_group": 1}},
+    ]
+
+
+def question_accuracy_pipeline(group=None):
+    return [
+        _completed(group),
+        *_unwind_recall_answers(),
+        {"$project": {
+            "artwork_id": "$answers.k",
+            "questions": {"$objectToArray": "$answers.v.recall_questions"},
+        }},
+        {"$unwind": "$questions"},
+        {"$group": {
+            "_id": {"artwork_id": "$artwork_id", "question_key": "$questions.k"},
+            "question": {"$first": "$questions.v.question"},
+            "answers": {"$sum": 1},
+            "accuracy": {"$avg": {"$cond": ["$questions.v.is_correct", 1, 0]}},
+        }},
+        {"$sort": {"_id.artwork_id": 1, "_id.question_key": 1}},
+    ]
+
+
+def _viewing_seconds(value):
+    # I tempi sono salvati come "m:ss" (a volte dentro una lista di un elemento)
+    text = {"$cond": [{"$isArray": value}, {"$arrayElemAt": [value, 0]}, value]}
+    parts = {"$split": [text, ":"]}
+    return {"$add": [
+        {"$multiply": [{"$toInt": {"$arrayElemAt": [parts, 0]}}, 60]},
+        {"$toInt": {"$arrayElemAt": [parts, 1]}},
+    ]}
+
+
+def _bucket_label(seconds):
+    branches = [
+        {"case": {"$lt": [seconds, upper]}, "then": f"{lower}-{upper}s"}
+        for lower, upper in zip(VIEWING_TIME_BUCKETS, VIEWING_TIME_BUCKETS[1:])
+    ]
+    return {"$switch": {"branches": branches, "default": f"{VIEWING_TIME_BUCKETS[-1]}s+"}}
+
+
+def viewing_time_distribution_pipeline(group=None):
+    return [
+        _completed(group),
+        {"$project": {"times": {"$objectToArray": "$artwork_viewing_times"}}},
+        {"$unwind": "$times"},
+        {"$project": {"artwork_id": "$times.k", "seconds": _viewing_seconds("$times.v")}},
+        {"$group": {
+            "_id": {"artwork_id": "$artwork_id", "bucket": _bucket_label("$seconds")},
+            "count": {"$sum": 1},
+            "mean_seconds": {"$avg": "$seconds"},
+            "min_seconds": {"$min": "$seconds"},
+            "max_seconds": {"$max": "$seconds"},
+        }},
+        {"$sort": {"_id.artwork_id": 1, "min_seconds": 1}},
+    ]
+
+
+def run_pipeline(collection, pipeline):
+    return list(analytics_collection(collection).aggregate(pipeline, allowDiskUse=True))
+
+
+def study_statistics(collection, group=None):
+    return {
+        "groups": run_pipeline(collection, group_recall_means_pipeline()),
+        "artworks": run_pipeline(collection, artwork_recall_means_pipeline(group)),
+        "questions": run_pipeline(collection, question_accuracy_pipeline(group)),
+        "viewing_times": run_pipeline(collection, viewing_time_distribution_pipeline(group)),
+    }
@@ -1,5 +1,11 @@
 import streamlit as st
 import random
+from utils import metrics, tracing
+
+DESCRIPTION_LOOKUPS = metrics.counter(
+    "artwork_description_lookups", "Origine delle descrizioni mostrate: cache di sessione, prefetch o chiamata dal vivo",
+    ("source",))
+_SESSION_LOOKUPS = DESCRIPTION_LOOKUPS.labels(source="session")
 
 ARTWORKS = [
     {
@@ -82,6 +88,8 @@ Il dipinto è così, in ogni caso, e se lo vedrai, ti piacerà straordinariament
     }
 ]
 
+ARTWORKS_BY_ID = {artwork['id']: artwork for artwork in ARTWORKS}
+
 def initialize_artwork_order():
     if 'artwork_order' not in st.session_state:
         artwork_indices = list(range(len(ARTWORKS)))
@@ -99,6 +107,9 @@ def get_artwork_by_index(index):
         return artwork
     return None
 
+def get_artwork_by_id(artwork_id):
+    return ARTWORKS_BY_ID.get(artwork_id)
+
 def get_all_artworks():
     initialize_artwork_order()
     return [ARTWORKS[i] for i in st.session_state.artwork_order]
@@ -112,37 +123,29 @@ def get_artwork_order_for_database():
         }
     return None
 
-def get_artwork_description(artwork, experimental_group, top_interests):
-    from api.description_generator import DescriptionGenerator
-    generator = DescriptionGenerator()
-   
-    artwork_id = artwork['id']
-    
-    # Controlla la cache
+def _get_cached_description(artwork, experimental_group, top_interests):
     cached_descriptions = st.session_state.get('generated_descriptions', {})
-    
-    if artwork_id in cached_descriptions:
-        cached = cached_descriptions[artwork_id]
-        same_artwork = (
-            cached.get('artwork_title') == artwork['title'] and
-            cached.get('artwork_artist') == artwork['artist']
-        )
-        same_group = cached.get('experimental_group') == experimental_group
-        same_interests = cached.get('top_interests') == top_interests
-
-        if same_artwork and same_group and same_interests:
-            return cached['description'], cached.get('selected_interest')
-    
-    # Genera nuova descrizione
-    description = generator.get_negative_personalized_description(artwork)
-    selected_interest = None
-        
+    cached = cached_descriptions.get(artwork['id'])
+    if not cached:
+        return None
+
+    same_artwork = (
+        cached.get('artwork_title') == artwork['title'] and
+        cached.get('artwork_artist') == artwork['artist']
+    )
+    same_group = cached.get('experimental_group') == experimental_group
+    same_interests = cached.get('top_interests') == top_interests
+
+    if same_artwork and same_group and same_interests:
+        return cached
+    return None
+
+def _save_cached_description(artwork, experimental_group, top_interests, description, selected_interest):
     # Inizializza cache se non esiste
     if 'generated_descriptions' not in st.session_state:
         st.session_state.generated_descriptions = {}
-    
-    # Salva in cache
-    st.session_state.generated_descriptions[artwork_id] = {
+
+    st.session_state.generated_descriptions[artwork['id']] = {
         'description': description,
         'experimental_group': experimental_group,
         'top_interests': top_interests,
@@ -150,5 +153,50 @@ def get_artwork_description(artwork, experimental_group, top_interests):
         'artwork_artist': artwork['artist'],
         'selected_interest': selected_interest
     }
-    
-    return description, selected_interest
\ No newline at end of file
+
+def prefetch_artwork_descriptions(experimental_group, top_interests):
+    """Avvia in background la generazione delle descrizioni di tutte le opere del partecipante"""
+    from api.prefetch import submit_description
+
+    futures = st.session_state.setdefault('description_futures', {})
+    for artwork in get_all_artworks():
+        if artwork['id'] in futures:
+            continue
+        if _get_cached_description(artwork, experimental_group, top_interests):
+            continue
+        futures[artwork['id']] = submit_description(artwork)
+
+def get_artwork_description(artwork, experimental_group, top_interests, on_chunk=None):
+    # Controlla la cache: è il percorso di ogni rerun, senza span
+    cached = _get_cached_description(artwork, experimental_group, top_interests)
+    if cached:
+        _SESSION_LOOKUPS.inc()
+        return cached['description'], cached.get('selected_interest')
+
+    with tracing.span("description.lookup", {"artwork.id": artwork['id']}) as attributes:
+        description, selected_interest, attributes["source"] = _lookup_description(
+            artwork, experimental_group, top_interests, on_chunk)
+    return description, selected_interest
+
+def _lookup_description(artwork, experimental_group, top_interests, on_chunk):
+    description = None
+    future = st.session_state.get('description_futures', {}).pop(artwork['id'], None)
+    if future is not None:
+        # Risultato del prefetch, già pronto o ancora in corso
+        try:
+            description = future.result()
+        except Exception:
+            description = None
+
+    source = "prefetch" if description is not None else "live"
+    DESCRIPTION_LOOKUPS.inc(source=source)
+    if description is None:
+        from api.description_generator import DescriptionGenerator
+        generator = DescriptionGenerator()
+        description = generator.get_negative_personalized_description(artwork, on_chunk=on_chunk)
+    selected_interest = None
+
+    # Salva in cache
+    _save_cached_description(artwork, experimental_group, top_interests, description, selected_interest)
+
+    return description, selected_interest, source
\ No newline at end of file
@@ -0,0 +1,164 @@
+import copy
+import datetime
+import logging
+import threading
+import time
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 200
+FLUSH_WINDOW = 5.0
+BACKOFF_MAX = 300.0
+# Un checkpoint che Mongo rifiuta (documento oltre 16 MB, percorso in conflitto...) viene scartato
+MAX_WRITE_ERROR_ATTEMPTS = 3
+
+
+class CheckpointBuffer:
+    """Raccoglie gli aggiornamenti parziali dei partecipanti e li scrive in blocco con bulk_write"""
+
+    def __init__(self, get_collection, max_batch=MAX_BATCH, window=FLUSH_WINDOW):
+        self.get_collection = get_collection
+        self.max_batch = max_batch
+        self.window = window
+        self.last_error = None
+        self.flushed_updates = 0
+        self.dropped_updates = 0
+        self._pending = {}
+        # participant_id -> errori di scrittura consecutivi; blocchi falliti di fila per il backoff
+        self._attempts = {}
+        self._failed_flushes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="participants-checkpoint", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self.flush()
+
+    def add(self, participant_id, fields):
+        """Unisce i campi a quelli già in attesa per lo stesso partecipante ($set coalescente)"""
+        with self._lock:
+            pending = self._pending.setdefault(participant_id, {})
+            pending.update(fields)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Con Mongo irraggiungibile l'attesa raddoppia a ogni blocco fallito
+            self._wake.wait(min(BACKOFF_MAX, self.window * 2 ** self._failed_flushes))
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            now = datetime.datetime.now()
+            participants = list(batch)
+            operations = [
+                UpdateOne(
+                    {"participant_id": participant_id},
+                    # flushed_at come nel write-behind: l'esportazione incrementale vede anche i parziali
+                    {"$set": batch[participant_id], "$setOnInsert": {"created_at": now},
+                     "$currentDate": {"flushed_at": True}},
+                    upsert=True,
+                )
+                for participant_id in participants
+            ]
+            write_errors = {}
+            try:
+                collection = self.get_collection()
+                if collection is None:
+                    raise ConnectionError("MongoDB non disponibile")
+                collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # ordered=False: le altre operazioni del blocco sono state applicate comunque
+                if e.details.get("writeConcernErrors") or not e.details.get("writeErrors"):
+                    return self._retry_batch(batch, e)
+                for error in e.details["writeErrors"]:
+                    write_errors[participants[error["index"]]] = error.get("errmsg", str(error))
+            except Exception as e:
+                return self._retry_batch(batch, e)
+
+            self._failed_flushes = 0
+            for participant_id in participants:
+                if participant_id not in write_errors:
+                    self._attempts.pop(participant_id, None)
+            self._handle_write_errors(batch, write_errors)
+            flushed = len(operations) - len(write_errors)
+            self.last_error = "; ".join(write_errors.values()) or None
+            self.flushed_updates += flushed
+            return flushed
+
+    def _retry_batch(self, batch, error):
+        """Errore dell'intero blocco (rete, write concern): tutto torna in coda, con backoff"""
+        self._requeue(batch)
+        self._failed_flushes += 1
+        self.last_error = str(error)
+        logger.warning("Checkpoint di %d partecipanti non scritto, nuovo tentativo: %s", len(batch), error)
+        return 0
+
+    def _handle_write_errors(self, batch, write_errors):
+        """Solo le operazioni rifiutate tornano in coda; dopo troppi rifiuti il checkpoint è scartato"""
+        retry = {}
+        for participant_id, message in write_errors.items():
+            attempts = self._attempts.get(participant_id, 0) + 1
+            if attempts >= MAX_WRITE_ERROR_ATTEMPTS:
+                # Il salvataggio finale passa dal journal e resta quello di riferimento
+                self._attempts.pop(participant_id, None)
+                self.dropped_updates += 1
+                logger.error("Checkpoint del partecipante %s scartato dopo %d rifiuti: %s",
+                             participant_id, attempts, message)
+            else:
+                self._attempts[participant_id] = attempts
+                retry[participant_id] = batch[participant_id]
+        if retry:
+            self._requeue(retry)
+
+    def _requeue(self, batch):
+        with self._lock:
+            for participant_id, fields in batch.items():
+                # I valori arrivati nel frattempo sono più recenti e vincono
+                merged = dict(fields)
+                merged.update(self._pending.get(participant_id, {}))
+                self._pending[participant_id] = merged
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending_participants": pending,
+            "flushed_updates": self.flushed_updates,
+            "dropped_updates": self.dropped_updates,
+            "last_error": self.last_error,
+        }
+
+
+def phase_fields(phase, fields):
+    """Campi da aggiornare per un passaggio di fase, con il timestamp della fase.
+
+    Copia profonda: i valori arrivano da st.session_state, che il run successivo continua a
+    modificare mentre il thread di flush li serializza fino a FLUSH_WINDOW secondi dopo.
+    """
+    update = copy.deepcopy(fields)
+    update["checkpoint_phase"] = phase
+    update[f"phase_timestamps.{phase}"] = time.time()
+    return update
@@ -0,0 +1,176 @@
+import importlib.util
+import logging
+import threading
+import time
+from pymongo import MongoClient, monitoring
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "mode": "atlas",
+    "max_pool_size": 50,
+    "min_pool_size": 2,
+    "server_selection_timeout_ms": 5000,
+    "connect_timeout_ms": 5000,
+    "socket_timeout_ms": 10000,
+    "health_ttl_seconds": 30,
+}
+
+
+def available_compressors():
+    # zstd e snappy richiedono pacchetti opzionali; zlib è sempre disponibile
+    compressors = []
+    if importlib.util.find_spec("zstandard"):
+        compressors.append("zstd")
+    if importlib.util.find_spec("snappy"):
+        compressors.append("snappy")
+    compressors.append("zlib")
+    return compressors
+
+
+class _EventRecorder(monitoring.ConnectionPoolListener, monitoring.ServerHeartbeatListener):
+    """Riporta gli eventi del driver sui log e in contatori, invece che nella pagina"""
+
+    def __init__(self):
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def pool_created(self, event):
+        logger.info("Pool MongoDB creato verso %s", event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count("pool_cleared")
+        logger.warning("Pool MongoDB svuotato per %s", event.address)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._count("checkout_failed")
+        logger.warning("Checkout di una connessione MongoDB fallito: %s", event.reason)
+
+    def connection_checked_out(self, event):
+        self._count("checkouts")
+
+    def connection_checked_in(self, event):
+        pass
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        self._count("heartbeat_failed")
+        logger.warning("Heartbeat MongoDB fallito per %s: %s", event.connection_id, event.reply)
+
+
+class ConnectionManager:
+    """Client MongoDB unico per processo, creato al primo utilizzo, con stato di salute in cache"""
+
+    def __init__(self, connection_string=None, database_name=None, **settings):
+        self.connection_string = connection_string
+        self.database_name = database_name
+        self.settings = dict(DEFAULT_SETTINGS, **settings)
+        self.events = _EventRecorder()
+        self._client = None
+        self._lock = threading.Lock()
+        self._health = {"ok": None, "checked_at": 0.0, "error": None}
+
+    @classmethod
+    def from_secrets(cls, mongo_secrets):
+        mongo_secrets = dict(mongo_secrets)
+        connection_string = mongo_secrets.pop("connection_string", None)
+        database_name = mongo_secrets.pop("database_name")
+        settings = {key: value for key, value in mongo_secrets.items() if key in DEFAULT_SETTINGS}
+        return cls(connection_string, database_name, **settings)
+
+    def _build_client(self):
+        if self.settings["mode"] == "memory":
+            try:
+                import mongomock
+            except ImportError as e:
+                raise ImportError('mode = "memory" richiede mongomock: pip install -r requirements-dev.txt') from e
+            logger.info("MongoDB in memoria (mongomock): nessun dato verrà salvato su disco")
+            return mongomock.MongoClient()
+
+        return MongoClient(
+            self.connection_string,
+            maxPoolSize=self.settings["max_pool_size"],
+            minPoolSize=self.settings["min_pool_size"],
+            serverSelectionTimeoutMS=self.settings["server_selection_timeout_ms"],
+            connectTimeoutMS=self.settings["connect_timeout_ms"],
+            socketTimeoutMS=self.settings["socket_timeout_ms"],
+            compressors=available_compressors(),
+            retryWrites=True,
+            retryReads=True,
+            event_listeners=[self.events],
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build_client()
+        return self._client
+
+    def get_database(self):
+        return self.client[self.database_name]
+
+    def get_collection(self, name):
+        return self.get_database()[name]
+
+    def is_healthy(self, force=False):
+        """Esito del ping, ripetuto solo quando il valore in cache è scaduto"""
+        now = time.monotonic()
+        if not force and now - self._health["checked_at"] < self.settings["health_ttl_seconds"]:
+            return self._health["ok"]
+        try:
+            self.client.admin.command("ping")
+            self._health.update(ok=True, error=None)
+        except Exception as e:
+            self._health.update(ok=False, error=str(e))
+            logger.warning("MongoDB non raggiungibile: %s", e)
+        self._health["checked_at"] = now
+        return self._health["ok"]
+
+    def stats(self):
+        healthy = self.is_healthy()
+        with self.events._lock:
+            counters = dict(self.events.counters)
+        return {
+            "mode": self.settings["mode"],
+            "connected": self._client is not None,
+            "healthy": healthy,
+            "health_error": self._health["error"],
+            "max_pool_size": self.settings["max_pool_size"],
+            "min_pool_size": self.settings["min_pool_size"],
+            "events": counters,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
@@ -0,0 +1,129 @@
+import datetime
+import hashlib
+import sqlite3
+import threading
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from utils.cache_lifecycle import cached_resource
+
+COLLECTION_NAME = "descriptions"
+
+
+def hash_text(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def _new_document(artwork_id, prompt_hash, facts_hash, description, model, version):
+    return {
+        "artwork_id": artwork_id,
+        "prompt_hash": prompt_hash,
+        "facts_hash": facts_hash,
+        "description": description,
+        "model": model,
+        "version": version,
+        "created_at": datetime.datetime.now(),
+    }
+
+
+class MongoDescriptionStore:
+    """Descrizioni generate, una per coppia (opera, hash del prompt)"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index([("artwork_id", ASCENDING), ("prompt_hash", ASCENDING)], unique=True)
+        self.collection.create_index([("artwork_id", ASCENDING), ("version", DESCENDING)])
+
+    def get(self, artwork_id, prompt_hash):
+        return self.collection.find_one({"artwork_id": artwork_id, "prompt_hash": prompt_hash}, {"_id": 0})
+
+    def get_latest(self, artwork_id):
+        return self.collection.find_one({"artwork_id": artwork_id}, {"_id": 0}, sort=[("version", DESCENDING)])
+
+    def save(self, artwork_id, prompt_hash, facts_hash, description, model, replace=False):
+        latest = self.get_latest(artwork_id)
+        version = latest["version"] + 1 if latest else 1
+        document = _new_document(artwork_id, prompt_hash, facts_hash, description, model, version)
+        # Se un altro processo ha già salvato lo stesso prompt, si mantiene la sua versione
+        return self.collection.find_one_and_update(
+            {"artwork_id": artwork_id, "prompt_hash": prompt_hash},
+            {"$set" if replace else "$setOnInsert": document},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+
+class SQLiteDescriptionStore:
+    """Sostituto locale della collezione Mongo, per test e sviluppo offline"""
+
+    def __init__(self, path=":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS descriptions (
+                    artwork_id TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    facts_hash TEXT,
+                    description TEXT NOT NULL,
+                    model TEXT,
+                    version INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (artwork_id, prompt_hash)
+                )"""
+            )
+
+    def _to_document(self, row):
+        if row is None:
+            return None
+        document = dict(row)
+        document["created_at"] = datetime.datetime.fromisoformat(document["created_at"])
+        return document
+
+    def get(self, artwork_id, prompt_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM descriptions WHERE artwork_id = ? AND prompt_hash = ?",
+                (artwork_id, prompt_hash),
+            ).fetchone()
+        return self._to_document(row)
+
+    def get_latest(self, artwork_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM descriptions WHERE artwork_id = ? ORDER BY version DESC LIMIT 1",
+                (artwork_id,),
+            ).fetchone()
+        return self._to_document(row)
+
+    def save(self, artwork_id, prompt_hash, facts_hash, description, model, replace=False):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT MAX(version) FROM descriptions WHERE artwork_id = ?", (artwork_id,)
+            ).fetchone()
+            version = (row[0] or 0) + 1
+            document = _new_document(artwork_id, prompt_hash, facts_hash, description, model, version)
+            self._conn.execute(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO descriptions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (artwork_id, prompt_hash, facts_hash, description, model, version,
+                 document["created_at"].isoformat()),
+            )
+        return self.get(artwork_id, prompt_hash)
+
+
+@cached_resource("description_store", show_spinner=False)
+def _mongo_description_store():
+    from database.mongo_handler import get_connection_manager
+    manager = get_connection_manager()
+    if not manager.is_healthy():
+        # Eccezione e non None: la cache non memorizza il fallimento e si riprova dopo il TTL del ping
+        raise ConnectionError("MongoDB non raggiungibile")
+    return MongoDescriptionStore(manager.get_collection(COLLECTION_NAME))
+
+
+def get_description_store():
+    try:
+        return _mongo_description_store()
+    except Exception:
+        # Senza store persistente si continua con la generazione dal vivo
+        return None
@@ -0,0 +1,17 @@
+# Categorie dell'inventario interessi: la pagina le mostra, l'esportazione ne fa colonne
+INTEREST_CATEGORIES = [
+    "Sport",
+    "Musica",
+    "Natura e Animali",
+    "Tecnologia e Gaming",
+    "Cibo e Cucina",
+    "Viaggi",
+    "Film e TV",
+    "Moda e Design",
+    "Scienza",
+    "Letteratura",
+    "Fotografia",
+    "Social Media",
+    "Storia",
+    "Attività all'aperto"
+]
@@ -1,67 +1,103 @@
 import streamlit as st
-from pymongo import MongoClient
 import datetime
-import random
-import string
+import logging
+import time
 import urllib.parse
+from pymongo.errors import OperationFailure
+from database.analytics import ensure_indexes
+from database.checkpoint import CheckpointBuffer, phase_fields
+from database.connection import ConnectionManager
+from database.participant_id import new_participant_id
+from database.write_behind import DEFAULT_JOURNAL_PATH, ParticipantJournal, WriteBehindFlusher
+from utils import metrics, tracing
+from utils.cache_lifecycle import process_resource
+
+logger = logging.getLogger(__name__)
+
+# Misura solo l'accodamento nel journal SQLite (fsync compreso): la scrittura su MongoDB avviene
+# dopo, nel thread di flush (participants_flush_duration_seconds, participants_mongo_write_lag_seconds)
+JOURNAL_APPEND_SECONDS = metrics.histogram(
+    "participant_journal_append_seconds",
+    "Durata dell'accodamento del documento nel journal locale, non della scrittura su MongoDB",
+    ("outcome",), buckets=metrics.FAST_BUCKETS)
+
+@process_resource("mongo_connection_manager")
+def get_connection_manager():
+    return ConnectionManager.from_secrets(st.secrets["mongodb"])
 
-@st.cache_resource(show_spinner=False)
 def get_mongo_connection():
+    # Il client viene creato alla prima richiesta, senza ping né messaggi nella pagina
     try:
-        connection_string = st.secrets["mongodb"]["connection_string"]
-        
-        # Log di debug (senza password)
-        st.write(f"🔍 Connessione a MongoDB...")
-        
-        client = MongoClient(connection_string, 
-                           serverSelectionTimeoutMS=10000,
-                           connectTimeoutMS=10000,
-                           socketTimeoutMS=10000)
-        
-        # Test connessione
-        client.admin.command('ping')
-        st.success("✅ Connessione MongoDB stabilita con successo!")
-        
-        return client
-        
-    except Exception as e:
-        st.error(f"❌ Errore connessione MongoDB: {str(e)}")
-        st.info("ℹ️ Verifica:")
-        st.info("1. Le secrets in .streamlit/secrets.toml")
-        st.info("2. La stringa di connessione di MongoDB Atlas")
-        st.info("3. L'accesso alla rete (IP whitelist)")
+        return get_connection_manager().client
+    except Exception:
         return None
 
 def generate_participant_id():
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M")
-    random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-    return f"P_{timestamp}_{random_part}"
+    # ULID con prefisso P_: ordinabile per tempo e senza collisioni tra thread e processi
+    return new_participant_id()
+
+# Condiviso da flusher e checkpoint: gli indici si tentano una volta per processo
+_indexes = {"ready": False}
+
+def _ensure_participant_indexes(collection):
+    """Crea gli indici senza mai bloccare le scritture: un errore finisce nel log, non nel flush"""
+    if _indexes["ready"]:
+        return
+    try:
+        ensure_indexes(collection)
+    except OperationFailure as e:
+        # Duplicati di participant_id, indice in conflitto, utente senza createIndex: riprovare non serve
+        logger.error("Indici della collezione participants non creati: %s", e)
+    except Exception as e:
+        # Errore di rete: si riprova al prossimo flush
+        logger.warning("Creazione degli indici di participants rimandata: %s", e)
+        return
+    _indexes["ready"] = True
+
+def get_participants_collection_getter():
+    manager = get_connection_manager()
+
+    def get_collection():
+        collection = manager.get_collection("participants")
+        _ensure_participant_indexes(collection)
+        return collection
+
+    return get_collection
+
+@process_resource("participants_write_behind")
+def get_write_behind():
+    journal_path = st.secrets.get("write_behind", {}).get("journal_path", DEFAULT_JOURNAL_PATH)
+    return WriteBehindFlusher(ParticipantJournal(journal_path), get_participants_collection_getter()).start()
+
+@process_resource("participants_checkpoints")
+def get_checkpoint_buffer():
+    return CheckpointBuffer(get_participants_collection_getter()).start()
+
+def save_checkpoint(participant_id, phase, fields):
+    """Aggiornamento parziale del documento del partecipante a fine fase; non blocca la pagina"""
+    try:
+        get_checkpoint_buffer().add(participant_id, phase_fields(phase, fields))
+    except Exception:
+        # Il checkpoint è solo una rete di sicurezza: il salvataggio finale resta quello di riferimento
+        pass
 
 def save_user_data(user_data):
+    """Scrive il documento nel journal locale; il thread di flush lo porta su MongoDB"""
+    start = time.perf_counter()
     try:
-        client = get_mongo_connection()
-        if not client:
-            st.error("⚠️ Impossibile connettersi al database")
-            return False, None
-            
-        db = client[st.secrets["mongodb"]["database_name"]]
-        collection = db["participants"]
-        
         user_data["created_at"] = datetime.datetime.now()
         
         if "participant_id" not in user_data:
             user_data["participant_id"] = generate_participant_id()
         
-        # Log dei dati da salvare (senza informazioni sensibili)
-        st.write(f"💾 Salvando dati per partecipante: {user_data['participant_id']}")
-        
-        result = collection.insert_one(user_data)
-        
-        st.success(f"✅ Dati salvati con ID: {result.inserted_id}")
+        with tracing.span("participant.journal_append", {"study_completed": bool(user_data.get("study_completed"))}):
+            get_write_behind().enqueue(user_data)
+        JOURNAL_APPEND_SECONDS.observe(time.perf_counter() - start, outcome="ok")
         return True, user_data["participant_id"]
         
     except Exception as e:
-        st.error(f"❌ Errore salvataggio MongoDB: {str(e)}")
+        JOURNAL_APPEND_SECONDS.observe(time.perf_counter() - start, outcome="error")
+        st.error(f"❌ Errore salvataggio dati: {str(e)}")
         import traceback
         st.code(traceback.format_exc())
         return False, None
\ No newline at end of file
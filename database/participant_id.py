@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+
+PREFIX = "P_"
+# Alfabeto base32 di Crockford: niente I, L, O, U, ordinamento lessicografico = ordinamento numerico
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+RANDOM_BITS = 80
+RANDOM_MAX = (1 << RANDOM_BITS) - 1
+
+# Coppie di caratteri precalcolate: si codificano 10 bit alla volta
+_PAIRS = [ALPHABET[i >> 5] + ALPHABET[i & 31] for i in range(1024)]
+
+_lock = threading.Lock()
+_last = {"ms": -1, "random": 0, "time_part": ""}
+
+
+def _encode_time(ms):
+    p = _PAIRS
+    return p[(ms >> 40) & 1023] + p[(ms >> 30) & 1023] + p[(ms >> 20) & 1023] + p[(ms >> 10) & 1023] + p[ms & 1023]
+
+
+def _encode_random(r):
+    p = _PAIRS
+    return (p[(r >> 70) & 1023] + p[(r >> 60) & 1023] + p[(r >> 50) & 1023] + p[(r >> 40) & 1023]
+            + p[(r >> 30) & 1023] + p[(r >> 20) & 1023] + p[(r >> 10) & 1023] + p[r & 1023])
+
+
+def _next_ulid_parts():
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last["ms"]:
+            _last["ms"] = now_ms
+            _last["random"] = int.from_bytes(os.urandom(10), "big")
+            _last["time_part"] = _encode_time(now_ms)
+        elif _last["random"] < RANDOM_MAX:
+            # Stesso millisecondo (o orologio all'indietro): si incrementa, così gli id restano crescenti
+            _last["random"] += 1
+        else:
+            _last["ms"] += 1
+            _last["random"] = int.from_bytes(os.urandom(10), "big")
+            _last["time_part"] = _encode_time(_last["ms"])
+        return _last["time_part"], _last["random"]
+
+
+def new_ulid():
+    """ULID monotono: 48 bit di millisecondi + 80 bit casuali, 26 caratteri"""
+    time_part, random_part = _next_ulid_parts()
+    return time_part + _encode_random(random_part)
+
+
+def new_participant_id():
+    return f"{PREFIX}{new_ulid()}"
+
+
+def participant_id_timestamp(participant_id):
+    """Istante di creazione (secondi epoch) codificato nell'id"""
+    value = 0
+    for char in participant_id[len(PREFIX):len(PREFIX) + 10]:
+        value = value * 32 + ALPHABET.index(char)
+    return value / 1000
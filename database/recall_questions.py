@@ -0,0 +1,61 @@
+import json
+import os
+from collections import namedtuple
+from types import MappingProxyType
+from utils.cache_lifecycle import cached_resource
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recall_questions.json")
+
+Question = namedtuple("Question", ["question", "options", "correct_index"])
+ArtworkQuestions = namedtuple("ArtworkQuestions", ["artwork_id", "title", "artist", "questions"])
+
+
+class QuestionBank:
+    """Domande del test di memoria, indicizzate per id dell'opera e in sola lettura"""
+
+    def __init__(self, order, artworks):
+        self.order = tuple(order)
+        self.by_id = MappingProxyType(artworks)
+
+    def get(self, artwork_id):
+        return self.by_id.get(artwork_id)
+
+    def ordered_for(self, artwork_ids):
+        """Opere viste dal partecipante, nell'ordine fisso del test"""
+        seen = set(artwork_ids)
+        return [artwork_id for artwork_id in self.order if artwork_id in seen and artwork_id in self.by_id]
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+def _parse_question(artwork_id, data):
+    options = tuple(data["options"])
+    if data["correct_answer"] not in options:
+        raise ValueError(f"{artwork_id}: risposta corretta non tra le opzioni in \"{data['question']}\"")
+    return Question(data["question"], options, options.index(data["correct_answer"]))
+
+
+def parse_question_bank(data):
+    artworks = {}
+    for artwork in data["artworks"]:
+        questions = tuple(_parse_question(artwork["id"], q) for q in artwork["questions"])
+        artworks[artwork["id"]] = ArtworkQuestions(artwork["id"], artwork["title"], artwork["artist"], questions)
+    order = data.get("order") or list(artworks)
+    return QuestionBank(order, artworks)
+
+
+def load_question_bank(path=QUESTIONS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return parse_question_bank(json.load(f))
+
+
+@cached_resource("recall_questions", show_spinner=False)
+def get_question_bank():
+    return load_question_bank()
+
+
+def score_answers(question_set, answer_indexes):
+    """Confronta gli indici scelti con quelli corretti; restituisce (esiti, punteggio)"""
+    results = [index == q.correct_index for q, index in zip(question_set.questions, answer_indexes)]
+    return results, sum(results)
@@ -0,0 +1,236 @@
+"""Stato della sessione del partecipante fuori dal processo, per riprendere lo studio dopo un reload.
+
+Solo le chiavi dello studio (STUDY_KEYS e i tempi start_time_N) sono scritte nello store, e solo
+quando cambiano. La chiave è un token casuale messo nell'URL (?session=...): riaprendo quell'URL,
+su qualsiasi replica, main_app ripristina lo stato e riparte dall'app_state salvato.
+
+Configurazione in secrets.toml (facoltativa, di default SQLite locale):
+    [session_store]
+    backend = "mongo"      # oppure "sqlite"
+    path = "data/sessions.db"
+    ttl_days = 7
+"""
+import datetime
+import hashlib
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+
+import streamlit as st
+from bson import json_util
+from pymongo import ASCENDING, IndexModel
+
+from utils.cache_lifecycle import process_resource
+from utils.query_params import get_query_param, remove_query_param, set_query_param
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PARAM = "session"
+COLLECTION_NAME = "sessions"
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sessions.db")
+DEFAULT_TTL_DAYS = 7
+
+STUDY_KEYS = (
+    "app_state",
+    "consent_given",
+    "participant_id",
+    "demographics",
+    "interest_ratings",
+    "top_3_interests",
+    "experimental_group",
+    "interests_start_time",
+    "interests_time_spent",
+    "profile_completed",
+    "artwork_order",
+    "artwork_order_ids",
+    "artwork_order_titles",
+    "current_artwork",
+    "viewing_completed",
+    "artworks_viewed",
+    "artwork_viewing_times",
+    "artwork_interests",
+    "generated_descriptions",
+    "recall_test_started",
+    "current_recall_artwork_index",
+    "recall_answers",
+    "test_start_time",
+    "test_submitted",
+    "show_results",
+    "feedback_given",
+    "user_feedback",
+    "data_saved",
+)
+STUDY_KEY_PREFIXES = ("start_time_",)
+
+# Chiavi interne in session_state, mai salvate
+_TOKEN_KEY = "_session_token"
+_DIGEST_KEY = "_session_digest"
+
+
+def is_study_key(key):
+    return key in STUDY_KEYS or key.startswith(STUDY_KEY_PREFIXES)
+
+
+def snapshot(session_state):
+    return {key: session_state[key] for key in list(session_state.keys()) if is_study_key(key)}
+
+
+def new_token():
+    return secrets.token_urlsafe(16)
+
+
+class SQLiteSessionBackend:
+    """Backend locale: una riga per token con lo stato serializzato"""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, ttl_days=DEFAULT_TTL_DAYS):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl_days = ttl_days
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    token TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    app_state TEXT,
+                    updated_at TEXT NOT NULL
+                )"""
+            )
+            cutoff = datetime.datetime.now() - datetime.timedelta(days=ttl_days)
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff.isoformat(),))
+
+    def load(self, token):
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM sessions WHERE token = ?", (token,)).fetchone()
+        return json_util.loads(row[0]) if row else None
+
+    def save(self, token, state):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (token, payload, app_state, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(token) DO UPDATE SET payload = excluded.payload, "
+                "app_state = excluded.app_state, updated_at = excluded.updated_at",
+                (token, json_util.dumps(state), state.get("app_state"), datetime.datetime.now().isoformat()),
+            )
+
+    def delete(self, token):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+
+class MongoSessionBackend:
+    """Backend condiviso tra repliche; le sessioni abbandonate scadono con un indice TTL"""
+
+    def __init__(self, collection, ttl_days=DEFAULT_TTL_DAYS):
+        self.collection = collection
+        self.ttl_days = ttl_days
+        self._index_ready = False
+
+    def _ensure_index(self):
+        if not self._index_ready:
+            self.collection.create_indexes([
+                IndexModel([("updated_at", ASCENDING)], name="session_ttl",
+                           expireAfterSeconds=int(self.ttl_days * 86400)),
+            ])
+            self._index_ready = True
+
+    def load(self, token):
+        document = self.collection.find_one({"_id": token}, {"payload": 1})
+        return json_util.loads(document["payload"]) if document else None
+
+    def save(self, token, state):
+        self._ensure_index()
+        # Lo stato è serializzato: le chiavi con punti (id delle opere) non diventano percorsi
+        self.collection.replace_one(
+            {"_id": token},
+            {
+                "payload": json_util.dumps(state),
+                "app_state": state.get("app_state"),
+                "participant_id": state.get("participant_id"),
+                "updated_at": datetime.datetime.utcnow(),
+            },
+            upsert=True,
+        )
+
+    def delete(self, token):
+        self.collection.delete_one({"_id": token})
+
+
+@process_resource("session_store")
+def get_session_store():
+    settings = st.secrets.get("session_store", {})
+    ttl_days = settings.get("ttl_days", DEFAULT_TTL_DAYS)
+    if settings.get("backend", "sqlite") == "mongo":
+        from database.mongo_handler import get_connection_manager
+        manager = get_connection_manager()
+        if not manager.is_healthy():
+            # Non memorizzato: i chiamanti registrano l'errore e riprovano, il ping ha il suo TTL
+            raise ConnectionError("MongoDB non raggiungibile, store delle sessioni non disponibile")
+        return MongoSessionBackend(manager.get_collection(COLLECTION_NAME), ttl_days)
+    return SQLiteSessionBackend(settings.get("path", DEFAULT_SQLITE_PATH), ttl_days)
+
+
+def _digest(state):
+    return hashlib.sha256(json_util.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+def current_token():
+    """Token della sessione corrente, o None prima di restore_session_state"""
+    return st.session_state.get(_TOKEN_KEY)
+
+
+def restore_session_state():
+    """Al primo run della sessione ripristina lo stato del token nell'URL, o ne crea uno nuovo"""
+    if _TOKEN_KEY in st.session_state:
+        return
+
+    token = get_query_param(TOKEN_PARAM)
+    state = None
+    if token:
+        try:
+            state = get_session_store().load(token)
+        except Exception as e:
+            logger.warning("Ripristino della sessione non riuscito: %s", e)
+
+    if state:
+        for key, value in state.items():
+            if is_study_key(key):
+                st.session_state[key] = value
+        st.session_state[_DIGEST_KEY] = _digest(state)
+    else:
+        # Token sconosciuto o scaduto: si riparte da capo con un token nuovo
+        token = new_token()
+        set_query_param(TOKEN_PARAM, token)
+    st.session_state[_TOKEN_KEY] = token
+
+
+def persist_session_state():
+    """Scrive le chiavi dello studio nello store, solo se sono cambiate dall'ultimo salvataggio"""
+    token = st.session_state.get(_TOKEN_KEY)
+    if not token:
+        return
+    state = snapshot(st.session_state)
+    digest = _digest(state)
+    if digest == st.session_state.get(_DIGEST_KEY):
+        return
+    try:
+        get_session_store().save(token, state)
+        st.session_state[_DIGEST_KEY] = digest
+    except Exception as e:
+        # Lo stato in memoria resta valido: si riprova al prossimo run
+        logger.warning("Salvataggio dello stato della sessione non riuscito: %s", e)
+
+
+def end_session():
+    """Cancella lo stato salvato e toglie il token dall'URL, a studio concluso"""
+    token = st.session_state.get(_TOKEN_KEY)
+    if token:
+        try:
+            get_session_store().delete(token)
+        except Exception as e:
+            logger.warning("Cancellazione dello stato della sessione non riuscita: %s", e)
+    remove_query_param(TOKEN_PARAM)
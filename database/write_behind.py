@@ -0,0 +1,294 @@
+import datetime
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "participants_journal.db")
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 2.0
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 300.0
+# Un documento rifiutato da Mongo (validazione, dimensione...) dopo tanti tentativi va in quarantena
+MAX_WRITE_ERROR_ATTEMPTS = 3
+FLUSHED_RETENTION = 24 * 3600
+PRUNE_INTERVAL = 3600
+
+FLUSH_SECONDS = metrics.histogram(
+    "participants_flush_duration_seconds", "Durata dei bulk_write dei partecipanti verso MongoDB", ("outcome",))
+WRITE_LAG_SECONDS = metrics.histogram(
+    "participants_mongo_write_lag_seconds",
+    "Tempo dall'ingresso nel journal locale alla scrittura su MongoDB, retry compresi",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0, 3600.0))
+FLUSHED_DOCUMENTS = metrics.counter(
+    "participants_flushed_documents", "Voci del journal portate su MongoDB o rimandate", ("outcome",))
+
+
+class ParticipantJournal:
+    """Journal locale append-only dei documenti completati, in attesa di essere scritti su Mongo"""
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL + synchronous=FULL: ogni commit è su disco prima di rispondere al partecipante
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS journal (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    participant_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    flushed_at REAL,
+                    quarantined_at REAL
+                )"""
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(journal)")}
+            if "quarantined_at" not in columns:
+                # Journal creato prima della quarantena
+                self._conn.execute("ALTER TABLE journal ADD COLUMN quarantined_at REAL")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS journal_pending ON journal (flushed_at, next_attempt_at)")
+
+    def append(self, document):
+        payload = json_util.dumps(document)
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO journal (participant_id, payload, enqueued_at) VALUES (?, ?, ?)",
+                (document["participant_id"], payload, now),
+            )
+            return cursor.lastrowid
+
+    def pending(self, limit=BATCH_SIZE, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, payload, attempts, enqueued_at FROM journal "
+                "WHERE flushed_at IS NULL AND quarantined_at IS NULL AND next_attempt_at <= ? "
+                "ORDER BY seq LIMIT ?",
+                (now, limit),
+            ).fetchall()
+        return [(seq, json_util.loads(payload), attempts, enqueued_at)
+                for seq, payload, attempts, enqueued_at in rows]
+
+    def mark_flushed(self, seqs):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE journal SET flushed_at = ? WHERE seq = ?", [(now, seq) for seq in seqs])
+
+    def mark_failed(self, seqs, error, delay):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE journal SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE seq = ?",
+                [(time.time() + delay, str(error)[:500], seq) for seq in seqs],
+            )
+
+    def mark_quarantined(self, seqs, error):
+        """Voci che Mongo continua a rifiutare: restano nel journal per il recupero manuale, fuori dalla coda"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE journal SET attempts = attempts + 1, quarantined_at = ?, last_error = ? WHERE seq = ?",
+                [(now, str(error)[:500], seq) for seq in seqs],
+            )
+
+    def prune(self, retention=FLUSHED_RETENTION):
+        """Elimina le voci già scritte su Mongo da più di retention secondi e compatta il file"""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM journal WHERE flushed_at IS NOT NULL AND flushed_at < ?", (time.time() - retention,)
+            ).rowcount
+            if deleted:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._conn.execute("VACUUM")
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            depth, oldest, max_attempts = self._conn.execute(
+                "SELECT COUNT(*), MIN(enqueued_at), MAX(attempts) FROM journal "
+                "WHERE flushed_at IS NULL AND quarantined_at IS NULL"
+            ).fetchone()
+            quarantined = self._conn.execute(
+                "SELECT COUNT(*) FROM journal WHERE quarantined_at IS NOT NULL").fetchone()[0]
+            last_flushed = self._conn.execute("SELECT MAX(flushed_at) FROM journal").fetchone()[0]
+        return {
+            "queue_depth": depth,
+            "quarantined": quarantined,
+            "flush_lag_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "max_attempts": max_attempts or 0,
+            "last_flushed_at": datetime.datetime.fromtimestamp(last_flushed).isoformat() if last_flushed else None,
+        }
+
+
+class WriteBehindFlusher:
+    """Thread in background che svuota il journal su Mongo con upsert idempotenti"""
+
+    def __init__(self, journal, get_collection, batch_size=BATCH_SIZE, interval=FLUSH_INTERVAL):
+        self.journal = journal
+        self.get_collection = get_collection
+        self.batch_size = batch_size
+        self.interval = interval
+        self.last_error = None
+        # seq -> (contesto di tracing, istante di ingresso nel journal) delle sessioni campionate
+        self._traces = {}
+        self._traces_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pruned_at = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="participants-write-behind", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def enqueue(self, document):
+        context = tracing.current_context()
+        if context is None:
+            seq = self.journal.append(document)
+        else:
+            # Sotto lock: il flush non può chiudere la voce prima che la traccia sia registrata,
+            # altrimenti resterebbe in _traces per sempre
+            with self._traces_lock:
+                enqueued_ns = time.time_ns()
+                seq = self.journal.append(document)
+                self._traces[seq] = (context, enqueued_ns)
+        self._wake.set()
+        return seq
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self.flush_once() == self.batch_size:
+                    pass
+                if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+                    self._pruned_at = time.monotonic()
+                    self.journal.prune()
+            except Exception as e:
+                logger.exception("Errore inatteso nel flush dei partecipanti: %s", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def flush_once(self):
+        """Scrive un blocco del journal; restituisce il numero di voci uscite dalla coda"""
+        batch = self.journal.pending(self.batch_size)
+        if not batch:
+            return 0
+
+        # Più voci per lo stesso partecipante: vale l'ultima, ma l'esito vale per tutte
+        latest, seqs_by_participant, attempts_by_seq = {}, {}, {}
+        for seq, document, attempts, _ in batch:
+            latest[document["participant_id"]] = document
+            seqs_by_participant.setdefault(document["participant_id"], []).append(seq)
+            attempts_by_seq[seq] = attempts
+        # $set e non replace: si conservano i campi scritti dai checkpoint di fase.
+        # flushed_at è l'ora del server alla scrittura (anche nei checkpoint): l'esportazione incrementale parte da lì
+        participants = list(latest)
+        operations = [
+            UpdateOne({"participant_id": participant_id},
+                      {"$set": latest[participant_id], "$currentDate": {"flushed_at": True}}, upsert=True)
+            for participant_id in participants
+        ]
+        seqs = [seq for seq, _, _, _ in batch]
+
+        start = time.perf_counter()
+        write_errors = {}
+        try:
+            collection = self.get_collection()
+            if collection is None:
+                raise ConnectionError("MongoDB non disponibile")
+            collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # ordered=False: le altre operazioni del blocco sono state applicate comunque
+            if e.details.get("writeConcernErrors") or not e.details.get("writeErrors"):
+                self._retry(seqs, attempts_by_seq, e, start)
+                return 0
+            for error in e.details["writeErrors"]:
+                write_errors[participants[error["index"]]] = error.get("errmsg", str(error))
+        except Exception as e:
+            self._retry(seqs, attempts_by_seq, e, start)
+            return 0
+
+        FLUSH_SECONDS.observe(time.perf_counter() - start, outcome="ok" if not write_errors else "partial")
+        rejected = {seq for participant_id in write_errors for seq in seqs_by_participant[participant_id]}
+        flushed = [seq for seq in seqs if seq not in rejected]
+        if flushed:
+            FLUSHED_DOCUMENTS.inc(len(flushed), outcome="ok")
+            self.journal.mark_flushed(flushed)
+            now = time.time()
+            for seq, _, _, enqueued_at in batch:
+                if seq not in rejected:
+                    WRITE_LAG_SECONDS.observe(now - enqueued_at)
+        quarantined = []
+        for participant_id, message in write_errors.items():
+            participant_seqs = seqs_by_participant[participant_id]
+            if max(attempts_by_seq[seq] for seq in participant_seqs) + 1 >= MAX_WRITE_ERROR_ATTEMPTS:
+                logger.error("Partecipante %s in quarantena dopo %d tentativi: %s",
+                             participant_id, MAX_WRITE_ERROR_ATTEMPTS, message)
+                self.journal.mark_quarantined(participant_seqs, message)
+                quarantined.extend(participant_seqs)
+            else:
+                FLUSHED_DOCUMENTS.inc(len(participant_seqs), outcome="failed")
+                self.journal.mark_failed(participant_seqs, message, self._backoff(participant_seqs, attempts_by_seq))
+        if quarantined:
+            FLUSHED_DOCUMENTS.inc(len(quarantined), outcome="quarantined")
+        self.last_error = "; ".join(write_errors.values()) or None
+        self._finish_traces(batch, set(flushed), set(quarantined))
+        return len(flushed) + len(quarantined)
+
+    @staticmethod
+    def _backoff(seqs, attempts_by_seq):
+        attempts = max(attempts_by_seq[seq] for seq in seqs)
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempts))
+
+    def _retry(self, seqs, attempts_by_seq, error, start):
+        """Errore dell'intero blocco (rete, write concern): tutto torna in coda con backoff"""
+        FLUSH_SECONDS.observe(time.perf_counter() - start, outcome="error")
+        FLUSHED_DOCUMENTS.inc(len(seqs), outcome="failed")
+        delay = self._backoff(seqs, attempts_by_seq)
+        self.journal.mark_failed(seqs, error, delay)
+        self.last_error = str(error)
+        logger.warning("Flush di %d documenti fallito, nuovo tentativo tra %.1fs: %s", len(seqs), delay, error)
+
+    def _finish_traces(self, batch, flushed, quarantined):
+        """Chiude lo span delle voci con esito definitivo (scritte o in quarantena) e le toglie da _traces;
+        quelle rifiutate ma ancora in coda restano fino al prossimo esito"""
+        now_ns = time.time_ns()
+        for seq, _, attempts, _ in batch:
+            if seq not in flushed and seq not in quarantined:
+                continue
+            with self._traces_lock:
+                traced = self._traces.pop(seq, None)
+            if traced:
+                context, enqueued_ns = traced
+                tracing.emit_span(context, "participant.mongo_write", enqueued_ns, now_ns,
+                                  {"journal.seq": seq, "attempts": attempts + 1},
+                                  error="in quarantena" if seq in quarantined else None)
+
+    def stats(self):
+        stats = self.journal.stats()
+        stats["last_error"] = self.last_error
+        stats["flusher_alive"] = bool(self._thread and self._thread.is_alive())
+        return stats
@@ -0,0 +1,282 @@
+"""Esporta i partecipanti in tabelle piatte (Parquet o CSV) per l'analisi.
+
+Uso:
+    python export_participants.py --out export/                  # Parquet, solo documenti nuovi
+    python export_participants.py --out export/ --format csv
+    python export_participants.py --out export/ --full           # ignora il watermark
+
+Vengono scritte due tabelle per esecuzione:
+    responses-<run>.<ext>     una riga per partecipante/opera/domanda
+    participants-<run>.<ext>  dati demografici, interessi e punteggi
+Il cursore legge a blocchi con una proiezione, quindi il dataset non sta mai tutto in memoria.
+Il watermark in <out>/watermark.json è il flushed_at più recente esportato, cioè l'ora del server
+all'ultima scrittura del documento, dal write-behind o da un checkpoint di fase (created_at è
+preso all'accodamento e un flush in ritardo finirebbe prima del watermark). Ogni esecuzione rilegge anche gli ultimi OVERLAP minuti, per le
+scritture ancora in viaggio verso i secondari, e salta gli _id già esportati in quella finestra.
+Un partecipante salvato di nuovo dopo l'esportazione ricompare nella successiva.
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+
+import streamlit as st
+from bson import ObjectId
+
+from database.analytics import analytics_collection, ensure_indexes
+from database.connection import ConnectionManager
+from database.interests import INTEREST_CATEGORIES
+
+BATCH_SIZE = 1000
+OVERLAP = datetime.timedelta(minutes=10)
+DEMOGRAPHIC_FIELDS = ["age", "gender", "education", "art_familiarity", "museum_visits"]
+
+PROJECTION = {
+    "participant_id": 1,
+    "created_at": 1,
+    "flushed_at": 1,
+    "experimental_group": 1,
+    "demographics": 1,
+    "all_interest_ratings": 1,
+    "top_3_interests": 1,
+    "interests_page_time": 1,
+    "artwork_order.artwork_ids": 1,
+    "recall_test.recall_answers": 1,
+    "recall_test.total_recall_score": 1,
+    "recall_test.total_recall_questions": 1,
+    "recall_test.test_duration": 1,
+    "study_completed": 1,
+}
+
+RESPONSE_COLUMNS = [
+    ("participant_id", "string"),
+    ("experimental_group", "string"),
+    ("created_at", "timestamp"),
+    ("artwork_id", "string"),
+    ("artwork_position", "int"),
+    ("question_key", "string"),
+    ("question", "string"),
+    ("answer", "string"),
+    ("correct_answer", "string"),
+    ("is_correct", "bool"),
+]
+
+PARTICIPANT_COLUMNS = [
+    ("participant_id", "string"),
+    ("experimental_group", "string"),
+    ("created_at", "timestamp"),
+    *[(f"demographics_{field}", "int" if field == "age" else "string") for field in DEMOGRAPHIC_FIELDS],
+    *[(f"interest_{category}", "int") for category in INTEREST_CATEGORIES],
+    ("top_3_interests", "string"),
+    ("interests_page_time", "float"),
+    ("total_recall_score", "int"),
+    ("total_recall_questions", "int"),
+    ("test_duration", "float"),
+    ("study_completed", "bool"),
+]
+
+
+def flatten_participant(document):
+    """Restituisce (riga partecipante, righe risposte) per un documento"""
+    recall_test = document.get("recall_test") or {}
+    demographics = document.get("demographics") or {}
+    ratings = document.get("all_interest_ratings") or {}
+    order = (document.get("artwork_order") or {}).get("artwork_ids") or []
+
+    participant = {
+        "participant_id": document.get("participant_id"),
+        "experimental_group": document.get("experimental_group"),
+        "created_at": document.get("created_at"),
+        "top_3_interests": "|".join(document.get("top_3_interests") or []),
+        "interests_page_time": document.get("interests_page_time"),
+        "total_recall_score": recall_test.get("total_recall_score"),
+        "total_recall_questions": recall_test.get("total_recall_questions"),
+        "test_duration": recall_test.get("test_duration"),
+        "study_completed": bool(document.get("study_completed")),
+    }
+    for field in DEMOGRAPHIC_FIELDS:
+        participant[f"demographics_{field}"] = demographics.get(field)
+    for category in INTEREST_CATEGORIES:
+        participant[f"interest_{category}"] = ratings.get(category)
+
+    responses = []
+    for artwork_id, answers in (recall_test.get("recall_answers") or {}).items():
+        position = order.index(artwork_id) if artwork_id in order else None
+        for question_key, response in (answers.get("recall_questions") or {}).items():
+            responses.append({
+                "participant_id": participant["participant_id"],
+                "experimental_group": participant["experimental_group"],
+                "created_at": participant["created_at"],
+                "artwork_id": artwork_id,
+                "artwork_position": position,
+                "question_key": question_key,
+                "question": response.get("question"),
+                "answer": response.get("answer"),
+                "correct_answer": response.get("correct_answer"),
+                "is_correct": response.get("is_correct"),
+            })
+    return participant, responses
+
+
+class CSVBatchWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=[name for name, _ in columns])
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetBatchWriter:
+    def __init__(self, path, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {
+            "string": pa.string(),
+            "int": pa.int64(),
+            "float": pa.float64(),
+            "bool": pa.bool_(),
+            "timestamp": pa.timestamp("ms"),
+        }
+        self._pa = pa
+        self._schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows):
+        # Ogni blocco diventa un row group: in memoria c'è solo il blocco corrente
+        if rows:
+            self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {"csv": CSVBatchWriter, "parquet": ParquetBatchWriter}
+
+
+def load_watermark(path):
+    """(flushed_at più recente, {_id: flushed_at} degli esportati nella finestra di sovrapposizione).
+
+    Un watermark del vecchio formato, basato su created_at, vale come assente: si riesporta tutto.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        flushed_at = datetime.datetime.fromisoformat(data["flushed_at"])
+    except (OSError, ValueError, KeyError):
+        return None
+    recent = {ObjectId(object_id): datetime.datetime.fromisoformat(value)
+              for object_id, value in data.get("recent", {}).items()}
+    return flushed_at, recent
+
+
+def save_watermark(path, flushed_at, recent):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"flushed_at": flushed_at.isoformat(),
+                   "recent": {str(object_id): value.isoformat() for object_id, value in recent.items()}}, f)
+    os.replace(tmp_path, path)
+
+
+def build_query(watermark=None, include_partial=False):
+    query = {} if include_partial else {"study_completed": True}
+    if watermark:
+        flushed_at, _ = watermark
+        query["flushed_at"] = {"$gte": flushed_at - OVERLAP}
+    return query
+
+
+def export(collection, out_dir, fmt="parquet", full=False, include_partial=False, batch_size=BATCH_SIZE):
+    os.makedirs(out_dir, exist_ok=True)
+    watermark_path = os.path.join(out_dir, "watermark.json")
+    watermark = None if full else load_watermark(watermark_path)
+
+    cursor = collection.find(
+        build_query(watermark, include_partial),
+        PROJECTION,
+        batch_size=batch_size,
+        sort=[("flushed_at", 1), ("_id", 1)],
+    )
+
+    run_id = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    writer_class = WRITERS[fmt]
+    paths = {
+        "participants": os.path.join(out_dir, f"participants-{run_id}.{fmt}"),
+        "responses": os.path.join(out_dir, f"responses-{run_id}.{fmt}"),
+    }
+    participants_writer = writer_class(paths["participants"], PARTICIPANT_COLUMNS)
+    responses_writer = writer_class(paths["responses"], RESPONSE_COLUMNS)
+
+    last_flushed, recent = watermark or (None, {})
+    recent = dict(recent)
+    exported = 0
+    participant_rows, response_rows = [], []
+    try:
+        for document in cursor:
+            flushed_at = document.get("flushed_at")
+            if flushed_at is not None and recent.get(document["_id"]) == flushed_at:
+                # Già esportato da un'esecuzione precedente, dentro la finestra di sovrapposizione
+                continue
+            participant, responses = flatten_participant(document)
+            participant_rows.append(participant)
+            response_rows.extend(responses)
+            if flushed_at is not None:
+                recent[document["_id"]] = flushed_at
+                last_flushed = max(last_flushed, flushed_at) if last_flushed else flushed_at
+            exported += 1
+            if len(participant_rows) >= batch_size:
+                participants_writer.write(participant_rows)
+                responses_writer.write(response_rows)
+                participant_rows, response_rows = [], []
+        participants_writer.write(participant_rows)
+        responses_writer.write(response_rows)
+    finally:
+        participants_writer.close()
+        responses_writer.close()
+
+    if exported == 0:
+        for path in paths.values():
+            os.remove(path)
+    elif last_flushed is not None:
+        # Il watermark avanza solo a esportazione completata
+        recent = {object_id: value for object_id, value in recent.items() if value >= last_flushed - OVERLAP}
+        save_watermark(watermark_path, last_flushed, recent)
+
+    return exported, paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Esportazione dei partecipanti per l'analisi")
+    parser.add_argument("--out", default="export", help="cartella di destinazione")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="parquet")
+    parser.add_argument("--full", action="store_true", help="esporta tutto ignorando il watermark")
+    parser.add_argument("--include-partial", action="store_true", help="include i partecipanti che non hanno finito")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    manager = ConnectionManager.from_secrets(st.secrets["mongodb"])
+    try:
+        # L'esportazione incrementale legge per flushed_at: l'indice va creato qui, non nel percorso di scrittura
+        ensure_indexes(manager.get_collection("participants"))
+    except Exception as e:
+        print(f"Indici di participants non creati, si esporta comunque: {e}", file=sys.stderr)
+    # Le esportazioni leggono dai secondari quando disponibili
+    collection = analytics_collection(manager.get_collection("participants"))
+
+    exported, paths = export(collection, args.out, args.format, args.full, args.include_partial, args.batch_size)
+    if exported:
+        print(f"Esportati {exported} partecipanti in {paths['participants']} e {paths['responses']}")
+    else:
+        print("Nessun partecipante nuovo da esportare")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,12 @@
 import streamlit as st
 import random
 import time
-from database.mongo_handler import generate_participant_id
+from database.interests import INTEREST_CATEGORIES
+from database.mongo_handler import generate_participant_id, save_checkpoint
+from utils.assets import inject_css
 
 def interessi_page():
-    def load_css():
-        try:
-            with open("style.css") as f:
-                st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-        except FileNotFoundError:
-            pass
-
-    load_css()
+    inject_css()
 
     if not st.session_state.get('demographics'):
         st.error("❌ Accesso non consentito. Completa prima la pagina iniziale.")
@@ -28,75 +23,65 @@ def interessi_page():
     st.markdown("""
     - Questa sezione ci aiuterà a comprendere meglio i tuoi interessi personali.
     - Per favore valuta quanto sei interessato a ciascuna delle seguenti categorie.
-    - Usa le slider per dare un voto da 1 a 5 per ogni interesse.
+    - Usa le slider per dare un voto da 1 a 5 per ogni interesse, poi premi **Profilo Completato**.
     """)
 
-    interest_categories = [
-        "Sport",
-        "Musica", 
-        "Natura e Animali",
-        "Tecnologia e Gaming",
-        "Cibo e Cucina",
-        "Viaggi",
-        "Film e TV",
-        "Moda e Design",
-        "Scienza",
-        "Letteratura",
-        "Fotografia",
-        "Social Media",
-        "Storia",
-        "Attività all'aperto"
-    ]
 
     if 'interest_ratings' not in st.session_state:
-        st.session_state.interest_ratings = {category: 1 for category in interest_categories}
+        st.session_state.interest_ratings = {category: 1 for category in INTEREST_CATEGORIES}
 
     st.markdown('<div class="section-header">Valuta i tuoi interessi</div>', unsafe_allow_html=True)
     st.caption("(1 = Per niente interessato, 5 = Molto interessato)")
 
-    col1, col2 = st.columns(2)
-    interests_per_col = len(interest_categories) // 2
-
-    with col1:
-        for category in interest_categories[:interests_per_col]:
-            st.slider(
-                category,
-                min_value=1, 
-                max_value=5, 
-                value=st.session_state.interest_ratings.get(category, 1),
-                key=f"rate_{category}",
-                on_change=lambda cat=category: st.session_state.interest_ratings.update({cat: st.session_state[f"rate_{cat}"]})
-            )
-
-    with col2:
-        for category in interest_categories[interests_per_col:]:
-            st.slider(
-                category,
-                min_value=1, 
-                max_value=5, 
-                value=st.session_state.interest_ratings.get(category, 1),
-                key=f"rate_{category}",
-                on_change=lambda cat=category: st.session_state.interest_ratings.update({cat: st.session_state[f"rate_{cat}"]})
-            )
-
-    if not st.session_state.get('profile_completed'):
-        submitted = st.button("Profilo Completato", type="primary", use_container_width=True)
-
-        if submitted:
-            interests_time_spent = time.time() - st.session_state.interests_start_time
-            st.session_state.interests_time_spent = interests_time_spent
-            ratings = st.session_state.interest_ratings
-            sorted_interests = sorted(ratings.items(), key=lambda x: x[1], reverse=True)
-            top_3_interests = [interest[0] for interest in sorted_interests[:3]]
-            st.session_state.top_3_interests = top_3_interests
-
-            if 'experimental_group' not in st.session_state:
-                st.session_state.experimental_group = 'C' 
-
+    profile_completed = st.session_state.get('profile_completed', False)
+
+    # Un solo form: i valori restano nel browser e arrivano tutti insieme all'invio, con un solo rerun
+    with st.form("interests_form"):
+        col1, col2 = st.columns(2)
+        interests_per_col = len(INTEREST_CATEGORIES) // 2
+
+        for column, categories in ((col1, INTEREST_CATEGORIES[:interests_per_col]),
+                                   (col2, INTEREST_CATEGORIES[interests_per_col:])):
+            with column:
+                for category in categories:
+                    st.slider(
+                        category,
+                        min_value=1,
+                        max_value=5,
+                        value=st.session_state.interest_ratings.get(category, 1),
+                        key=f"rate_{category}",
+                        disabled=profile_completed
+                    )
+
+        submitted = st.form_submit_button(
+            "Profilo Completato", type="primary", use_container_width=True, disabled=profile_completed
+        )
+
+    if submitted and not profile_completed:
+        st.session_state.interest_ratings = {
+            category: st.session_state[f"rate_{category}"] for category in INTEREST_CATEGORIES
+        }
+        interests_time_spent = time.time() - st.session_state.interests_start_time
+        st.session_state.interests_time_spent = interests_time_spent
+        ratings = st.session_state.interest_ratings
+        sorted_interests = sorted(ratings.items(), key=lambda x: x[1], reverse=True)
+        top_3_interests = [interest[0] for interest in sorted_interests[:3]]
+        st.session_state.top_3_interests = top_3_interests
+
+        if 'experimental_group' not in st.session_state:
+            st.session_state.experimental_group = 'C' 
+
+        if 'participant_id' not in st.session_state:
             st.session_state.participant_id = generate_participant_id()
-            st.session_state.data_saved = True 
-            st.session_state.profile_completed = True
-            st.rerun()
+        save_checkpoint(st.session_state.participant_id, "interests", {
+            'all_interest_ratings': ratings,
+            'top_3_interests': top_3_interests,
+            'experimental_group': st.session_state.experimental_group,
+            'interests_page_time': interests_time_spent
+        })
+        st.session_state.data_saved = True 
+        st.session_state.profile_completed = True
+        st.rerun()
             
     if st.session_state.get('profile_completed'):
         st.success("✅ Profilo completato con successo!")
@@ -1,33 +1,70 @@
 import streamlit as st
-st.cache_data.clear()
-st.cache_resource.clear()
+import time
+from utils import metrics, payload_accounting, profiling, tracing
+from utils.cache_lifecycle import ensure_cache_version, render_admin_stats
+from api.http_client import get_http_client
+from database.mongo_handler import get_checkpoint_buffer, get_connection_manager, get_write_behind
+from database.session_store import persist_session_state, restore_session_state
 
 st.set_page_config(page_title="Studio Artistico", page_icon="🎨", layout="wide")
 
+SCRIPT_RUN_SECONDS = metrics.histogram(
+    "script_run_duration_seconds", "Durata di un run dello script per pagina (app_state all'inizio del run)",
+    ("app_state",))
+run_started = time.perf_counter()
+# Endpoint/file delle metriche, se configurati in [metrics]: avviati una volta per processo
+metrics.ensure_exporters()
+
+# Le cache sopravvivono ai rerun: si svuotano solo se cambia la versione dei contenuti
+ensure_cache_version()
+render_admin_stats(
+    openrouter=lambda: get_http_client().get_metrics(),
+    mongodb=lambda: get_connection_manager().stats(),
+    write_behind=lambda: get_write_behind().stats(),
+    checkpoints=lambda: get_checkpoint_buffer().stats()
+)
+
+# Dopo un reload (o su un'altra replica) lo stato torna dallo store tramite il token nell'URL
+restore_session_state()
+
 if 'app_state' not in st.session_state:
     st.session_state.app_state = "welcome"
 
 main_container = st.container()
+# Span di fase e contesto per gli span di questo run, se la sessione è campionata
+tracing.begin_run(st.session_state.app_state)
 
 with main_container:
     current_state = st.session_state.app_state
-    
-    if current_state == "welcome":
-        from welcome_page import welcome_page
-        welcome_page()
+    # Solo con STUDY_PROFILE o ?profile=<token admin>: profilo del dispatch, per app_state
+    run_profile = profiling.start_run(current_state)
+    run_payload = None
+    try:
+        # Byte inviati al browser dalla pagina, per punto di chiamata (solo se [payload_accounting] è configurato).
+        # Dentro il try: il finally rimette sempre l'enqueue originale del contesto
+        run_payload = payload_accounting.start_run()
+        if current_state == "welcome":
+            from welcome_page import welcome_page
+            welcome_page()
         
-    elif current_state == "interests":
-        from interessi_page import interessi_page
-        interessi_page()
+        elif current_state == "interests":
+            from interessi_page import interessi_page
+            interessi_page()
         
-    elif current_state == "art_warning":
-        from art_warning_page import render
-        render()
+        elif current_state == "art_warning":
+            from art_warning_page import render
+            render()
         
-    elif current_state == "art_viewing":
-        from artwork_viewer_page import render
-        render()
+        elif current_state == "art_viewing":
+            from artwork_viewer_page import render
+            render()
         
-    elif current_state == "recall":
-        from recall_page import render
-        render()
\ No newline at end of file
+        elif current_state == "recall":
+            from recall_page import render
+            render()
+    finally:
+        profiling.stop_run(run_profile)
+        # Anche st.rerun() e st.stop() passano di qui: lo stato aggiornato è salvato prima del run successivo
+        persist_session_state()
+        SCRIPT_RUN_SECONDS.observe(time.perf_counter() - run_started, app_state=current_state)
+        payload_accounting.stop_run(run_payload, current_state)
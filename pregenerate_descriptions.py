@@ -0,0 +1,81 @@
+"""Pre-genera le descrizioni di tutte le opere e le salva nello store persistente.
+
+Uso:
+    python pregenerate_descriptions.py                 # Mongo (da .streamlit/secrets.toml)
+    python pregenerate_descriptions.py --sqlite descrizioni.db
+    python pregenerate_descriptions.py --workers 4 --force
+
+Vengono rigenerate solo le opere il cui prompt (fatti o template) è cambiato.
+"""
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import streamlit as st
+
+from api.description_generator import DescriptionGenerator, MODEL
+from database.artwork_data import ARTWORKS
+from database.connection import ConnectionManager
+from database.description_store import COLLECTION_NAME, MongoDescriptionStore, SQLiteDescriptionStore
+
+
+def open_store(sqlite_path=None):
+    if sqlite_path:
+        return SQLiteDescriptionStore(sqlite_path)
+    manager = ConnectionManager.from_secrets(st.secrets["mongodb"])
+    return MongoDescriptionStore(manager.get_collection(COLLECTION_NAME))
+
+
+def plan_generation(generator, store, artworks, force=False):
+    """Restituisce le opere da (ri)generare con prompt e hash già calcolati"""
+    pending = []
+    for artwork in artworks:
+        prompt, prompt_hash, facts_hash = generator.get_prompt_and_hashes(artwork)
+        if force or not store.get(artwork['id'], prompt_hash):
+            pending.append((artwork, prompt, prompt_hash, facts_hash))
+    return pending
+
+
+def generate_one(generator, store, artwork, prompt, prompt_hash, facts_hash, replace=False):
+    description = generator._call_openrouter_api(prompt)
+    if not description:
+        return artwork['id'], None
+    return artwork['id'], store.save(artwork['id'], prompt_hash, facts_hash, description.strip(), MODEL, replace=replace)
+
+
+def pregenerate(store, artworks=ARTWORKS, workers=3, force=False, generator=None):
+    generator = generator or DescriptionGenerator()
+    pending = plan_generation(generator, store, artworks, force=force)
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(generate_one, generator, store, *job, replace=force) for job in pending]
+        for future in as_completed(futures):
+            artwork_id, document = future.result()
+            results[artwork_id] = document
+
+    return results, len(artworks) - len(pending)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generazione delle descrizioni delle opere")
+    parser.add_argument("--sqlite", help="usa un database SQLite locale invece di MongoDB")
+    parser.add_argument("--workers", type=int, default=3, help="numero massimo di chiamate parallele")
+    parser.add_argument("--force", action="store_true", help="rigenera anche le descrizioni aggiornate")
+    args = parser.parse_args(argv)
+
+    store = open_store(args.sqlite)
+    results, skipped = pregenerate(store, workers=args.workers, force=args.force)
+
+    failed = [artwork_id for artwork_id, document in results.items() if document is None]
+    for artwork_id, document in results.items():
+        if document:
+            print(f"✅ {artwork_id}: versione {document['version']}")
+    for artwork_id in failed:
+        print(f"❌ {artwork_id}: generazione fallita")
+    print(f"Generate: {len(results) - len(failed)}, invariate: {skipped}, fallite: {len(failed)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
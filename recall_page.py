@@ -6,16 +6,15 @@ from datetime import datetime
 
 sys.path.append(os.path.dirname(__file__))
 
-from database.artwork_data import get_all_artworks
-from database.mongo_handler import save_user_data
+from database.artwork_data import get_artwork_by_id
+from database.recall_questions import get_question_bank, score_answers
+from database.mongo_handler import save_checkpoint, save_user_data
+from database.session_store import end_session
+from utils.assets import inject_css
+from utils.tracing import end_trace
 
 def render():
-    def load_css():
-        css_path = os.path.join(os.getcwd(), "style.css")
-        with open(css_path) as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-
-    load_css()
+    inject_css()
 
     required_states = ['demographics', 'top_3_interests', 'experimental_group', 'participant_id', 'viewing_completed']
     if not all(st.session_state.get(state) for state in required_states):
@@ -33,290 +32,8 @@ def render():
 
     st.markdown('<div class="main-title">Test di Memoria</div>', unsafe_allow_html=True)
 
-    RECALL_QUESTIONS = {
-        "opera_3": {
-            "title": "Le quattro stagioni in una testa",
-            "artist": "Giuseppe Arcimboldo",
-            "questions": [
-                {
-                    "question": "Chi ha ricevuto il dipinto?",
-                    "options": [
-                        "Un cardinale di Roma",
-                        "Un letterato di Mantova", 
-                        "Un principe tedesco",
-                        "Un banchiere veneziano",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Un letterato di Mantova"
-                },
-                {
-                    "question": "Quando è stato dipinto?",
-                    "options": [
-                        "Circa 1470",
-                        "Circa 1610", 
-                        "Circa 1720",
-                        "Circa 1590",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Circa 1590"
-                },
-                {
-                    "question": "Su cosa è dipinto?",
-                    "options": [
-                        "Tela di lino",
-                        "Tavola di quercia",
-                        "Muro intonacato",
-                        "Legno di pioppo",
-                        "Non mi ricordo",
-                    ],
-                    "correct_answer": "Legno di pioppo"
-                },
-                {
-                    "question": "Chi è l'artista del dipinto?",
-                    "options": [
-                        "Giuseppe Arcimboldo",
-                        "Leon Battista Alberti",
-                        "Paolo Veronese",
-                        "Tiziano",
-                        "Non mi ricordo", 
-                    ],
-                    "correct_answer": "Giuseppe Arcimboldo"
-                },
-                {
-                    "question": "Di cosa è fatta la barba?",
-                    "options": [
-                        "Lana", 
-                        "Paglia",
-                        "Muschio",
-                        "Radici",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Muschio"
-                },
-                {
-                    "question": "Cosa pende dall'orecchio?",
-                    "options": [
-                        "Perle",
-                        "Ciliegie",
-                        "Ghiaccioli",
-                        "Fiori",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Ciliegie",
-                },
-                {
-                    "question": "Cosa simboleggia il tronco spoglio?",
-                    "options": [
-                        "L'inverno che non produce nulla",
-                        "La vecchiaia e la saggezza",
-                        "La morte che tutto trasforma", 
-                        "La forza nascosta della natura",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "L'inverno che non produce nulla",
-                },
-                {
-                    "question": "Come viene descritto il piccolo fiore sul petto della figura?",
-                    "options": [
-                        "Simbolo dell'innocenza",
-                        "Simbolo della primavera",
-                        "Ornamento decorativo",
-                        "Rappresentazione dell'estate",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Simbolo della primavera",
-                }
-            ]
-        },
-        "opera_1": {
-            "title": "Pellegrinaggio ai Cedri in Libano",
-            "artist": "Tivadar Csontváry Kosztka", 
-            "questions": [
-                {
-                    "question": "Chi è l'artista del dipinto?",
-                    "options": [
-                        "Tivadar Csontváry Kosztka",
-                        "Gustav Klimt",
-                        "Mihály Munkácsy",
-                        "Pál Szinyei Merse",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Tivadar Csontváry Kosztka",
-                },
-                {
-                    "question": "Cosa simboleggia principalmente l'albero di cedro nel dipinto?",
-                    "options": [
-                        "La fertilità della natura",
-                        "La persona dell'artista stesso", 
-                        "La religiosità popolare",
-                        "La forza della nazione ungherese",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer":  "La persona dell'artista stesso", 
-                },
-                {
-                    "question": "Come è descritto l'albero centrale?",
-                    "options": [
-                        "Un tronco unico e maestoso",
-                        "Tre tronchi intrecciati",
-                        "Multiple radici esposte",
-                        "Doppio tronco al centro",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Doppio tronco al centro",
-                },
-                {
-                    "question": "Cosa succede attorno all'albero nel dipinto?",
-                    "options": [
-                        "Una tempesta in avvicinamento",
-                        "Una celebrazione che ricorda antichi rituali",
-                        "Un incendio boschivo", 
-                        "Una cerimonia nuziale",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Una celebrazione che ricorda antichi rituali",
-                },
-                {
-                    "question": "Le figure nel dipinto sono:",
-                    "options": [
-                        "Solo donne",
-                        "Uomini e animali",
-                        "Solo bambini",
-                        "Non ci sono figure",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Uomini e animali",
-                },
-                {
-                    "question": "In quale anno è stato realizzato il dipinto?",
-                    "options": [
-                        "circa 1834", 
-                        "circa 1959",
-                        "circa 1783",
-                        "circa 1907",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "circa 1907",
-                },
-                {
-                    "question": "Quale tecnica pittorica è stata utilizzata?",
-                    "options": [
-                        "Olio su tela",
-                        "Tempera su tavola", 
-                        "Acquerello su carta",
-                        "Affresco",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Olio su tela",
-                },
-                {
-                    "question": "Come sono i colori del dipinto?",
-                    "options": [
-                        "Tenui e pastello", 
-                        "Molto scuri e spenti",
-                        "Irreali e simbolici",
-                        "Bianco e nero",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Irreali e simbolici",
-                }
-            ]
-        },
-        "opera_2": {
-            "title": "Il cambiavalute e sua moglie",
-            "artist": "Quentin Massys",
-            "questions": [
-                {
-                    "question": "Chi è l'artista del dipinto?",
-                    "options": [
-                        "Quentin Massys",
-                        "Pieter Bruegel il Vecchio",
-                        "Jan van Eyck", 
-                        "Hieronymus Bosch",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Quentin Massys"
-                },
-                {
-                    "question": "In quale anno è stato realizzato il dipinto?",
-                    "options": [
-                        "1485",
-                        "1530", 
-                        "1550",
-                        "1514",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "1514"
-                },
-                {
-                    "question": "Quale tecnica pittorica è stata utilizzata?",
-                    "options": [
-                        "Tempera su tavola",
-                        "Olio su tela",
-                        "Affresco",
-                        "Olio su tavola",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Olio su tavola"
-                },
-                {
-                    "question": "Cosa riflette lo specchio convesso nel dipinto?",
-                    "options": [
-                        "Una finestra con paesaggio",
-                        "L'autoritratto dell'artista",
-                        "La città di Anversa",
-                        "Un altro cliente del cambiavalute",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "L'autoritratto dell'artista"
-                },
-                {
-                    "question": "Quale artista precedente viene citato nel dipinto attraverso lo specchio?",
-                    "options": [
-                        "Jan van Eyck",
-                        "Rogier van der Weyden",
-                        "Robert Campin",
-                        "Hans Memling",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Jan van Eyck"
-                },
-                {
-                    "question": "Cosa sta facendo la moglie nel dipinto?",
-                    "options": [
-                        "Conta monete",
-                        "Cuce un abito",
-                        "Scrive una lettera",
-                        "Sfoglia un libro",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Sfoglia un libro"
-                },
-                {
-                    "question": "Quale genere pittorico rappresenta questo dipinto?",
-                    "options": [
-                        "Ritratto ufficiale",
-                        "Pittura storica",
-                        "Pittura di genere",
-                        "Natura morta",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Pittura di genere"
-                },
-                {
-                    "question": "Come sono descritte le espressioni dei personaggi?",
-                    "options": [
-                        "Gioiose e vivaci",
-                        "Angosciate e preoccupate",
-                        "Curiose e interessate",
-                        "Indifferenti e distaccate",
-                        "Non mi ricordo"
-                    ],
-                    "correct_answer": "Indifferenti e distaccate"
-                }
-            ]
-        }
-    } 
+    question_bank = get_question_bank()
+
 
     if not st.session_state.recall_test_started:
         st.markdown("""
@@ -339,75 +56,64 @@ def render():
 
     else:
         
-        FIXED_ARTWORK_ORDER = [
-            "10661-17csont.jpg",
-            "24610-moneylen.jpg",  
-            "02502-5season.jpg"     
-        ]
+        # Ordine fisso del test, limitato alle opere viste dal partecipante
+        recall_order = question_bank.ordered_for(st.session_state.get('artwork_order_ids', question_bank.order))
         
         current_index = st.session_state.current_recall_artwork_index
         
-        if current_index < len(FIXED_ARTWORK_ORDER):
-            artwork_id = FIXED_ARTWORK_ORDER[current_index]
-            all_artworks = get_all_artworks()
-            artwork = next((art for art in all_artworks if art['id'] == artwork_id), None)
-            
-            recall_data = {
-                "10661-17csont.jpg": RECALL_QUESTIONS["opera_1"],
-                "24610-moneylen.jpg": RECALL_QUESTIONS["opera_2"], 
-                "02502-5season.jpg": RECALL_QUESTIONS["opera_3"]
-            }.get(artwork_id, {})
+        if current_index < len(recall_order):
+            artwork_id = recall_order[current_index]
+            recall_data = question_bank.get(artwork_id)
+            artwork = get_artwork_by_id(artwork_id)
+            artwork_title = artwork['title'] if artwork else recall_data.title
             
-            st.progress((current_index) / len(FIXED_ARTWORK_ORDER), text=f"Opera {current_index + 1} di {len(FIXED_ARTWORK_ORDER)}")
+            st.progress((current_index) / len(recall_order), text=f"Opera {current_index + 1} di {len(recall_order)}")
             
-            st.markdown(f'<h3>"{artwork["title"]}"</h3>', unsafe_allow_html=True)
+            st.markdown(f'<h3>"{artwork_title}"</h3>', unsafe_allow_html=True)
             
             with st.form(key=f"recall_form_{current_index}"):
                 
                 st.subheader("**Domande specifiche sull'opera:**")
-                recall_responses = {}
+                answer_indexes = []
                 
-                if recall_data and "questions" in recall_data:
-                    for i, q_data in enumerate(recall_data["questions"]):
-                        st.markdown(f"**{q_data['question']}**")
-                        answer = st.radio(
-                            f"Seleziona la risposta corretta:",
-                            options=q_data["options"],
-                            key=f"q_{current_index}_{i}",
-                            index=None
-                        )
-                        recall_responses[f"q_{i+1}"] = {
-                            "question": q_data["question"],
-                            "answer": answer,
-                            "correct_answer": q_data["correct_answer"],
-                            "is_correct": None
-                        }
+                for i, q_data in enumerate(recall_data.questions):
+                    st.markdown(f"**{q_data.question}**")
+                    answer_indexes.append(st.radio(
+                        f"Seleziona la risposta corretta:",
+                        options=range(len(q_data.options)),
+                        format_func=lambda option, options=q_data.options: options[option],
+                        key=f"q_{current_index}_{i}",
+                        index=None
+                    ))
                 
                 submitted = st.form_submit_button("Salva e Procedi", use_container_width=True)
                 
                 if submitted:
-                    all_questions_answered = all(response["answer"] is not None for response in recall_responses.values())
+                    unanswered_questions = [i + 1 for i, answer_index in enumerate(answer_indexes) if answer_index is None]
                     
-                    if not all_questions_answered:
-                        unanswered_questions = [i + 1 for i, (q_key, response) in enumerate(recall_responses.items()) if response["answer"] is None]
+                    if unanswered_questions:
                         st.error(f"❌ **Devi rispondere a tutte le domande prima di procedere.** Domande mancanti: {', '.join(map(str, unanswered_questions))}")
                     else:
-                        recall_score = 0
-                        total_questions = len(recall_responses)
+                        results, recall_score = score_answers(recall_data, answer_indexes)
                         
-                        for q_key, response in recall_responses.items():
-                            if response["answer"] == response["correct_answer"]:
-                                recall_responses[q_key]["is_correct"] = True
-                                recall_score += 1
-                            else:
-                                recall_responses[q_key]["is_correct"] = False
+                        recall_responses = {}
+                        for i, (q_data, answer_index, is_correct) in enumerate(zip(recall_data.questions, answer_indexes, results)):
+                            recall_responses[f"q_{i+1}"] = {
+                                "question": q_data.question,
+                                "answer": q_data.options[answer_index],
+                                "correct_answer": q_data.options[q_data.correct_index],
+                                "is_correct": is_correct
+                            }
                         
-                        st.session_state.recall_answers[artwork['id']] = {
+                        st.session_state.recall_answers[artwork_id] = {
                             'recall_questions': recall_responses,
                             'recall_score': recall_score,
-                            'total_recall_questions': total_questions,
+                            'total_recall_questions': len(recall_responses),
                             'timestamp': time.time()
                         }
+                        save_checkpoint(st.session_state.participant_id, f"recall_{current_index + 1}", {
+                            'recall_test.recall_answers': st.session_state.recall_answers
+                        })
                         
                         st.session_state.current_recall_artwork_index += 1
                         st.rerun()
@@ -538,12 +244,11 @@ def render():
                     final_data['generated_descriptions'] = st.session_state.get('generated_descriptions', {})
                     final_data['artwork_selected_interests'] = st.session_state.get('artwork_interests', {})
                     
-                    try:
-                        save_user_data(final_data)
+                    saved, _ = save_user_data(final_data)
+                    if saved:
                         st.session_state.data_saved = True
+                        end_trace()
                         st.success("✅ I tuoi dati sono stati salvati con successo!")
-                    except Exception as e:
-                        st.error(f"Errore nel salvataggio dei dati: {e}")
                 else:
                     st.info("ℹ️ I dati sono già stati salvati.")
                 
@@ -556,6 +261,7 @@ def render():
                 """, unsafe_allow_html=True)
                 
                 if st.button("Termina Studio", type="primary", use_container_width=True):
+                    end_session()
                     for key in list(st.session_state.keys()):
                         del st.session_state[key]
                     st.session_state.app_state = "welcome"
@@ -0,0 +1,84 @@
+import streamlit as st
+import hashlib
+import os
+import re
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Intervallo minimo tra due controlli dell'mtime: nei rerun ravvicinati niente I/O su disco
+CHECK_INTERVAL = 2.0
+
+_lock = threading.Lock()
+_assets = {}
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+MINIFIERS = {
+    ".css": minify_css,
+}
+
+
+def _read_asset(name, path, mtime):
+    with open(path, encoding="utf-8") as f:
+        raw = f.read()
+    minify = MINIFIERS.get(os.path.splitext(name)[1])
+    content = minify(raw) if minify else raw
+    return {
+        "mtime": mtime,
+        "checked_at": time.monotonic(),
+        "content": content,
+        "hash": hashlib.sha256(raw.encode("utf-8")).hexdigest(),
+        "html": None,
+    }
+
+
+def _get_entry(name):
+    now = time.monotonic()
+    with _lock:
+        entry = _assets.get(name)
+        if entry and now - entry["checked_at"] < CHECK_INTERVAL:
+            return entry
+
+    path = os.path.join(APP_DIR, name)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    with _lock:
+        entry = _assets.get(name)
+        if entry and entry["mtime"] == mtime:
+            entry["checked_at"] = now
+            return entry
+
+    entry = _read_asset(name, path, mtime)
+    with _lock:
+        _assets[name] = entry
+    return entry
+
+
+def load_asset(name):
+    """Contenuto (minificato se possibile) di un file statico dell'app, letto una volta per processo"""
+    entry = _get_entry(name)
+    return entry["content"] if entry else None
+
+
+def get_asset_hash(name):
+    entry = _get_entry(name)
+    return entry["hash"] if entry else ""
+
+
+def inject_css(name="style.css"):
+    entry = _get_entry(name)
+    if not entry:
+        return
+    if entry["html"] is None:
+        entry["html"] = f"<style>{entry['content']}</style>"
+    st.markdown(entry["html"], unsafe_allow_html=True)
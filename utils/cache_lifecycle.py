@@ -0,0 +1,170 @@
+import streamlit as st
+import functools
+import hashlib
+import json
+import threading
+from utils.assets import get_asset_hash
+from utils.query_params import get_query_param, remove_query_param
+
+ADMIN_CLEAR_PARAM = "clear_cache"
+ADMIN_STATS_PARAM = "cache_stats"
+
+# Stato condiviso da tutte le sessioni dello stesso processo
+_lock = threading.Lock()
+_state = {
+    "version": None,
+    "invalidations": 0,
+}
+_counters = {}
+# Risorse di processo (process_resource): fuori da st.cache_resource, mai svuotate
+_resources_lock = threading.RLock()
+_resources = {}
+
+
+def _hash_secrets():
+    try:
+        secrets = st.secrets.to_dict()
+    except Exception:
+        return ""
+    return hashlib.sha256(json.dumps(secrets, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def compute_cache_version():
+    """Versione dei contenuti/configurazione da cui dipendono le cache"""
+    from database.artwork_data import ARTWORKS
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps(ARTWORKS, sort_keys=True).encode())
+    digest.update(get_asset_hash("style.css").encode())
+    digest.update(get_asset_hash("database/recall_questions.json").encode())
+    digest.update(_hash_secrets().encode())
+    return digest.hexdigest()[:16]
+
+
+def _clear_all():
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    _state["invalidations"] += 1
+
+
+def _admin_token():
+    try:
+        return st.secrets["admin"]["token"]
+    except Exception:
+        return None
+
+
+def is_admin_request(name):
+    token = _admin_token()
+    return bool(token) and get_query_param(name) == token
+
+
+def ensure_cache_version():
+    """Invalida le cache solo se la versione cambia o se lo richiede un admin"""
+    with _lock:
+        version = compute_cache_version()
+        if _state["version"] is None:
+            _state["version"] = version
+        elif _state["version"] != version:
+            _clear_all()
+            _state["version"] = version
+
+        if is_admin_request(ADMIN_CLEAR_PARAM):
+            _clear_all()
+            # Tolto dall'URL: i rerun successivi non svuotano di nuovo, ma riaprendo
+            # ?clear_cache=<token> nella stessa sessione si svuota ancora
+            remove_query_param(ADMIN_CLEAR_PARAM)
+
+    return version
+
+
+def _record(name, field):
+    with _lock:
+        counter = _counters.setdefault(name, {"hits": 0, "misses": 0})
+        counter[field] += 1
+
+
+def cached_resource(name, **cache_kwargs):
+    """Come st.cache_resource, ma conta hit e miss sotto il nome indicato"""
+    return _counted(name, st.cache_resource, cache_kwargs)
+
+
+def process_resource(name):
+    """Singleton di processo per risorse con thread, pool o socket, con hit e miss contati.
+
+    Non passa da st.cache_resource: _clear_all lo abbandonerebbe ancora attivo (thread di
+    flush doppi sullo stesso journal, executor e connessioni mai chiusi). Vive quanto il
+    processo, quindi un cambio della sua configurazione nei secrets richiede un riavvio.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = (name, args)
+            resource = _resources.get(key)
+            if resource is None:
+                # RLock: la costruzione di una risorsa può chiederne un'altra (flusher -> connessione)
+                with _resources_lock:
+                    resource = _resources.get(key)
+                    if resource is None:
+                        _record(name, "misses")
+                        resource = _resources[key] = func(*args)
+                        return resource
+            _record(name, "hits")
+            return resource
+
+        return wrapper
+
+    return decorator
+
+
+def cached_data(name, **cache_kwargs):
+    """Come st.cache_data, ma conta hit e miss sotto il nome indicato"""
+    return _counted(name, st.cache_data, cache_kwargs)
+
+
+def _counted(name, cache_decorator, cache_kwargs):
+    def decorator(func):
+        local = threading.local()
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            # Eseguita solo quando la cache non contiene il valore
+            local.missed = True
+            return func(*args, **kwargs)
+
+        cached = cache_decorator(**cache_kwargs)(compute)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            local.missed = False
+            result = cached(*args, **kwargs)
+            _record(name, "misses" if local.missed else "hits")
+            return result
+
+        wrapper.clear = cached.clear
+        return wrapper
+
+    return decorator
+
+
+def get_cache_stats():
+    with _lock:
+        caches = {}
+        for name, counter in _counters.items():
+            total = counter["hits"] + counter["misses"]
+            caches[name] = dict(counter, hit_ratio=counter["hits"] / total if total else 0.0)
+        return {
+            "version": _state["version"],
+            "invalidations": _state["invalidations"],
+            "caches": caches,
+        }
+
+
+def render_admin_stats(**extra_sections):
+    """Mostra agli admin le statistiche delle cache e delle sezioni aggiuntive (callable)"""
+    if is_admin_request(ADMIN_STATS_PARAM):
+        with st.sidebar:
+            st.json(get_cache_stats())
+            for name, get_stats in extra_sections.items():
+                st.caption(name)
+                st.json(get_stats())
@@ -0,0 +1,146 @@
+import streamlit as st
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import threading
+import time
+from utils import metrics
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGES_DIR = os.path.join(APP_DIR, "images")
+STATIC_DIR = os.path.join(APP_DIR, "static", "artworks")
+STATIC_URL = "app/static/artworks"
+MANIFEST_PATH = os.path.join(STATIC_DIR, "manifest.json")
+SIZES = "(max-width: 768px) 100vw, min(50vw, 700px)"
+
+# Solo i cache miss: le letture già in memoria non passano dal disco né dalla codifica
+IMAGE_SECONDS = metrics.histogram(
+    "image_load_duration_seconds", "Lettura dal disco e codifica base64 delle immagini", ("stage",),
+    buckets=metrics.FAST_BUCKETS)
+
+# Cache di processo: percorso -> contenuto, hash e payload già codificati
+_lock = threading.Lock()
+_entries = {}
+_manifest = {"mtime": None, "data": {}}
+
+
+def _load(filename):
+    path = os.path.join(IMAGES_DIR, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    with _lock:
+        entry = _entries.get(path)
+        if entry and entry["mtime"] == mtime:
+            return entry
+
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    IMAGE_SECONDS.observe(time.perf_counter() - start, stage="read")
+    entry = {
+        "mtime": mtime,
+        "bytes": data,
+        "hash": hashlib.sha256(data).hexdigest()[:12],
+        "mime_type": mimetypes.guess_type(filename)[0] or "image/jpeg",
+        "data_uri": None,
+        "url": None,
+    }
+    with _lock:
+        _entries[path] = entry
+    return entry
+
+
+def get_image_bytes(filename):
+    entry = _load(filename)
+    return entry["bytes"] if entry else None
+
+
+def get_image_data_uri(filename):
+    entry = _load(filename)
+    if not entry:
+        return None
+    if entry["data_uri"] is None:
+        with IMAGE_SECONDS.time(stage="encode"):
+            encoded = base64.b64encode(entry["bytes"]).decode()
+            entry["data_uri"] = f"data:{entry['mime_type']};base64,{encoded}"
+    return entry["data_uri"]
+
+
+def _publish(filename, entry):
+    # Copia l'originale in ./static solo se il contenuto è cambiato
+    target = os.path.join(STATIC_DIR, filename)
+    try:
+        with open(target, "rb") as f:
+            up_to_date = hashlib.sha256(f.read()).hexdigest()[:12] == entry["hash"]
+    except OSError:
+        up_to_date = False
+    if not up_to_date:
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(os.path.join(IMAGES_DIR, filename), tmp_path)
+        os.replace(tmp_path, target)
+
+
+def get_image_url(filename):
+    """URL statico dell'immagine; il parametro v fa sì che il browser la tenga in cache a lungo"""
+    entry = _load(filename)
+    if not entry:
+        return None
+    if entry["url"] is None:
+        _publish(filename, entry)
+        entry["url"] = f"{STATIC_URL}/{filename}?v={entry['hash']}"
+    return entry["url"]
+
+
+def get_image_src(filename):
+    # Senza static serving si torna al data URI, comunque codificato una sola volta
+    if st.get_option("server.enableStaticServing"):
+        return get_image_url(filename)
+    return get_image_data_uri(filename)
+
+
+def _load_manifest():
+    # Generato da build_image_derivatives.py; riletto solo se cambia
+    try:
+        mtime = os.stat(MANIFEST_PATH).st_mtime_ns
+    except OSError:
+        return {}
+    with _lock:
+        if _manifest["mtime"] != mtime:
+            with open(MANIFEST_PATH) as f:
+                _manifest["data"] = json.load(f)
+            _manifest["mtime"] = mtime
+        return _manifest["data"]
+
+
+def _srcset(variants):
+    return ", ".join(f"{STATIC_URL}/{v['file']}?v={v['hash']} {v['width']}w" for v in variants)
+
+
+def get_image_html(filename, style):
+    """Tag <picture> con srcset WebP/JPEG se esistono le varianti, altrimenti un semplice <img>"""
+    entry = _load_manifest().get(filename) if st.get_option("server.enableStaticServing") else None
+    # Le varianti più grandi dell'originale non sono nel manifest: un formato può restare vuoto
+    if entry and entry["variants"]["jpeg"]:
+        jpeg = entry["variants"]["jpeg"]
+        fallback = next((v for v in jpeg if v["width"] >= 700), jpeg[-1])
+        webp = entry["variants"]["webp"]
+        webp_source = f'<source type="image/webp" srcset="{_srcset(webp)}" sizes="{SIZES}">' if webp else ""
+        return (
+            f'<picture>'
+            f'{webp_source}'
+            f'<img src="{STATIC_URL}/{fallback["file"]}?v={fallback["hash"]}" srcset="{_srcset(jpeg)}" '
+            f'sizes="{SIZES}" width="{entry["width"]}" height="{entry["height"]}" style="{style}">'
+            f'</picture>'
+        )
+
+    image_src = get_image_src(filename)
+    if not image_src:
+        return None
+    return f'<img src="{image_src}" style="{style}">'
@@ -0,0 +1,314 @@
+"""Contatori e istogrammi di processo, esportati nel formato testuale di Prometheus.
+
+Le metriche si registrano a livello di modulo e si aggiornano solo dopo l'avvio di un
+esportatore: senza [metrics] ogni aggiornamento è un controllo su una variabile globale.
+Gli istogrammi si aggiornano sotto lock; i contatori no: ogni thread incrementa la propria
+cella, che alla fine del thread confluisce nel totale, e l'export le somma. Sui percorsi caldi si usa il figlio restituito da labels(),
+ottenuto una volta a livello di modulo.
+
+Esportazione (facoltativa) configurata in secrets.toml:
+    [metrics]
+    port = 9464                    # http://127.0.0.1:9464/metrics
+    host = "127.0.0.1"
+    textfile = "data/metrics.prom" # per il textfile collector di node_exporter
+    interval = 15                  # secondi tra una scrittura del file e la successiva
+"""
+import bisect
+import contextlib
+import logging
+import os
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_INTERVAL = 15
+
+# Senza un esportatore avviato nessuno legge le metriche: gli aggiornamenti si saltano
+_collecting = False
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: etichette attese {self.labelnames}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._snapshot())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+
+class _ThreadToken:
+    """Vive nel threading.local del thread: quando il thread termina, la sua cella viene ritirata"""
+
+    __slots__ = ("__weakref__",)
+
+
+class _CounterChild:
+    """Contatore di una combinazione di etichette, senza lock sull'incremento: ogni thread scrive
+    solo la propria cella. I thread che terminano (script run, pool) lasciano il conteggio in
+    _retired, quindi le celle non crescono con il numero di thread visti dal processo."""
+
+    __slots__ = ("_local", "_cells", "_retired", "_lock")
+
+    def __init__(self):
+        self._local = threading.local()
+        self._cells = {}
+        self._retired = 0
+        # RLock: il ritiro di una cella può scattare mentre lo stesso thread legge il valore
+        self._lock = threading.RLock()
+
+    def inc(self, amount=1):
+        if not _collecting:
+            return
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0] += amount
+
+    def _new_cell(self):
+        cell = [0]
+        token = _ThreadToken()
+        key = id(token)
+        with self._lock:
+            self._cells[key] = cell
+        self._local.cell = cell
+        self._local.token = token
+        weakref.finalize(token, self._retire, key)
+        return cell
+
+    def _retire(self, key):
+        with self._lock:
+            self._retired += self._cells.pop(key)[0]
+
+    def value(self):
+        with self._lock:
+            return self._retired + sum(cell[0] for cell in list(self._cells.values()))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def labels(self, **labels):
+        """Figlio per una combinazione di etichette: sui percorsi caldi va ottenuto una volta sola"""
+        key = self._key(labels)
+        child = self._values.get(key)
+        if child is None:
+            with self._lock:
+                child = self._values.setdefault(key, _CounterChild())
+        return child
+
+    def inc(self, amount=1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def value(self, **labels):
+        child = self._values.get(self._key(labels))
+        return child.value() if child is not None else 0
+
+    def _snapshot(self):
+        return [(key, child.value()) for key, child in self._values.items()]
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not _collecting:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Conteggi per bucket (l'ultimo è +Inf), somma, numero di osservazioni
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _snapshot(self):
+        return [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+
+    def _render_sample(self, key, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        # main_app.py è rieseguito a ogni run: la seconda registrazione restituisce la stessa metrica
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"La metrica {name} esiste già con un altro tipo")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _start_collecting():
+    global _collecting
+    _collecting = True
+
+
+def start_http_exporter(port, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    # Solo con la porta ottenuta: se il bind fallisce nessuno leggerà le metriche
+    _start_collecting()
+    return server
+
+
+def write_textfile(path):
+    # Scrittura atomica: il collector non legge mai un file a metà
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, path)
+
+
+def start_textfile_exporter(path, interval=DEFAULT_INTERVAL):
+    def run():
+        while True:
+            try:
+                write_textfile(path)
+                # Dalla prima scrittura riuscita: con il percorso non scrivibile non si raccoglie nulla
+                _start_collecting()
+            except OSError as e:
+                logger.warning("Scrittura delle metriche in %s non riuscita: %s", path, e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-textfile", daemon=True)
+    thread.start()
+    return thread
+
+
+# Gli esportatori vivono quanto il processo: non in cache_resource, che un admin può svuotare
+_exporters_lock = threading.Lock()
+_exporters = {"started": False}
+
+
+def ensure_exporters():
+    """Avvia una sola volta per processo gli esportatori configurati in [metrics]"""
+    if _exporters["started"]:
+        return
+    with _exporters_lock:
+        if _exporters["started"]:
+            return
+        _exporters["started"] = True
+        try:
+            settings = st.secrets.get("metrics", {})
+        except Exception:
+            settings = {}
+        if settings.get("port"):
+            try:
+                _exporters["http"] = start_http_exporter(int(settings["port"]), settings.get("host", "127.0.0.1"))
+            except OSError as e:
+                # Un'altra istanza sulla stessa macchina ha già la porta
+                logger.warning("Endpoint delle metriche non avviato sulla porta %s: %s", settings["port"], e)
+        if settings.get("textfile"):
+            _exporters["textfile"] = start_textfile_exporter(settings["textfile"], settings.get("interval", DEFAULT_INTERVAL))
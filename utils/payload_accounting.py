@@ -0,0 +1,141 @@
+"""Byte ed elementi inviati al browser da ogni run dello script, per pagina e punto di chiamata.
+
+Ogni ForwardMsg accodato durante il run è misurato (dimensione serializzata) e attribuito
+alla riga dell'app che lo ha prodotto, es. art_warning_page.py:25 per il warning-box o
+utils/assets.py per il CSS. È un limite superiore dei byte sul websocket: i messaggi oltre
+global.minCachedMessageSize (10 KB) che il browser ha già ricevuto partono come riferimento.
+
+Configurazione in secrets.toml (senza path è spento):
+    [payload_accounting]
+    path = "data/payload.jsonl"   # un record JSON per run
+    sample_rate = 1.0             # frazione dei run misurati
+
+analysis/payload_report.py ordina i contributi più pesanti.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOAD_BYTES = metrics.histogram(
+    "script_run_payload_bytes", "Byte serializzati inviati al browser in un run dello script", ("app_state",),
+    buckets=(1e3, 5e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6))
+
+# Come gli altri esportatori: configurazione letta una volta per processo
+_lock = threading.Lock()
+_config = {"loaded": False, "path": None, "sample_rate": 1.0}
+
+
+def _load_config():
+    if _config["loaded"]:
+        return
+    with _lock:
+        if _config["loaded"]:
+            return
+        try:
+            settings = st.secrets.get("payload_accounting", {})
+        except Exception:
+            settings = {}
+        _config["path"] = settings.get("path")
+        _config["sample_rate"] = float(settings.get("sample_rate", 1.0))
+        _config["loaded"] = True
+
+
+def _call_site():
+    """Riga dell'app più interna nello stack: chi ha chiamato la funzione di Streamlit"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename != __file__:
+            return f"{os.path.relpath(filename, APP_DIR)}:{frame.f_lineno}"
+        frame = frame.f_back
+    return "streamlit"
+
+
+def _message_kind(msg):
+    kind = msg.WhichOneof("type")
+    if kind != "delta":
+        return kind
+    delta_kind = msg.delta.WhichOneof("type")
+    if delta_kind == "new_element":
+        return msg.delta.new_element.WhichOneof("type")
+    return delta_kind
+
+
+class RunPayload:
+    """Accumula i messaggi di un run sostituendo per la sua durata l'enqueue del contesto"""
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.started = time.time()
+        self.bytes = 0
+        self.messages = 0
+        self.elements = 0
+        self.by_site = {}
+        self._original = ctx._enqueue
+        ctx._enqueue = self._enqueue
+
+    def _enqueue(self, msg):
+        size = msg.ByteSize()
+        kind = _message_kind(msg)
+        key = f"{_call_site()} {kind}"
+        entry = self.by_site.get(key)
+        if entry is None:
+            entry = self.by_site[key] = [0, 0]
+        entry[0] += size
+        entry[1] += 1
+        self.bytes += size
+        self.messages += 1
+        self.elements += msg.HasField("delta")
+        self._original(msg)
+
+    def restore(self):
+        self.ctx._enqueue = self._original
+
+
+def start_run():
+    """Inizia la misura del run, se configurata; va chiamata prima degli elementi della pagina,
+    dentro un try il cui finally chiama stop_run"""
+    _load_config()
+    if not _config["path"] or random.random() >= _config["sample_rate"]:
+        return None
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None
+    return RunPayload(ctx)
+
+
+def stop_run(run, app_state):
+    if run is None:
+        return
+    run.restore()
+    PAYLOAD_BYTES.observe(run.bytes, app_state=app_state)
+    record = {
+        "ts": run.started,
+        "app_state": app_state,
+        "bytes": run.bytes,
+        "messages": run.messages,
+        "elements": run.elements,
+        "by_site": {key: {"bytes": size, "count": count} for key, (size, count) in run.by_site.items()},
+    }
+    try:
+        directory = os.path.dirname(_config["path"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(record) + "\n"
+        with _lock:
+            with open(_config["path"], "a") as f:
+                f.write(line)
+    except OSError as e:
+        logger.warning("Scrittura del payload del run non riuscita: %s", e)
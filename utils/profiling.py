@@ -0,0 +1,172 @@
+"""Profilazione su richiesta dei run dello script, aggregata per app_state.
+
+Si attiva per tutto il processo con una variabile d'ambiente, o per una sola sessione con il
+parametro admin nell'URL (?profile=<token admin>, facoltativo &profile_mode=sampling):
+    STUDY_PROFILE=cprofile          # cprofile, sampling o both
+    STUDY_PROFILE_RATE=0.1          # frazione dei run profilati (default 1)
+    STUDY_PROFILE_INTERVAL_MS=5     # intervallo del campionatore
+    STUDY_PROFILE_DIR=data/profiles
+
+Per ogni app_state e processo si aggiornano, dopo ogni run profilato:
+    <app_state>.<pid>.pstats     (cprofile: leggibile con pstats o snakeviz)
+    <app_state>.<pid>.collapsed  (sampling: stack collassati per flamegraph.pl o speedscope)
+analysis/profile_report.py confronta le pagine.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from utils.cache_lifecycle import is_admin_request
+from utils.query_params import get_query_param
+
+logger = logging.getLogger(__name__)
+
+ADMIN_PROFILE_PARAM = "profile"
+ADMIN_MODE_PARAM = "profile_mode"
+MODES = ("cprofile", "sampling", "both")
+DEFAULT_INTERVAL_MS = 5.0
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = os.path.join(APP_DIR, "data", "profiles")
+
+
+def _env_settings():
+    mode = os.environ.get("STUDY_PROFILE", "").strip().lower()
+    if mode in ("1", "true", "yes"):
+        mode = "cprofile"
+    return {
+        "mode": mode if mode in MODES else None,
+        "rate": float(os.environ.get("STUDY_PROFILE_RATE", 1.0)),
+        "interval": float(os.environ.get("STUDY_PROFILE_INTERVAL_MS", DEFAULT_INTERVAL_MS)) / 1000,
+        "dir": os.environ.get("STUDY_PROFILE_DIR", DEFAULT_DIR),
+    }
+
+
+# Letta una volta: a profilazione spenta ogni run costa un confronto e il controllo del parametro admin
+_settings = _env_settings()
+
+# Aggregati di processo per app_state, condivisi dalle sessioni
+_lock = threading.Lock()
+_stats = {}
+_stacks = {}
+
+
+class StackSampler:
+    """Campiona a intervalli regolari lo stack di un thread (quello dello script in esecuzione)"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_collapse(frame)] += 1
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    # Percorsi relativi per il codice dell'app, solo il nome file per librerie e stdlib
+    if code.co_filename.startswith(APP_DIR):
+        filename = os.path.relpath(code.co_filename, APP_DIR)
+    else:
+        filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class RunProfile:
+    def __init__(self, app_state, mode, interval):
+        self.app_state = app_state
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.profiler = None
+        self.sampler = None
+        if mode in ("cprofile", "both"):
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Dalla 3.12 un solo profiler deterministico per processo: questo run si salta
+                self.profiler = None
+        if mode in ("sampling", "both"):
+            self.sampler = StackSampler(threading.get_ident(), interval).start()
+
+
+def _requested_mode():
+    if _settings["mode"]:
+        return _settings["mode"]
+    if is_admin_request(ADMIN_PROFILE_PARAM):
+        mode = get_query_param(ADMIN_MODE_PARAM, "cprofile")
+        return mode if mode in MODES else "cprofile"
+    return None
+
+
+def start_run(app_state):
+    """Avvia la profilazione del run, se richiesta; restituisce il profilo da passare a stop_run"""
+    mode = _requested_mode()
+    if mode is None or random.random() >= _settings["rate"]:
+        return None
+    return RunProfile(app_state, mode, _settings["interval"])
+
+
+def stop_run(run):
+    """Ferma la profilazione e aggiorna i file della pagina; un errore di scrittura non interrompe il run"""
+    if run is None:
+        return
+    if run.profiler is not None:
+        run.profiler.disable()
+    samples = run.sampler.stop() if run.sampler is not None else None
+    try:
+        _save(run, samples)
+    except Exception as e:
+        logger.warning("Salvataggio del profilo di %s non riuscito: %s", run.app_state, e)
+
+
+def _save(run, samples):
+    os.makedirs(_settings["dir"], exist_ok=True)
+    base = os.path.join(_settings["dir"], f"{run.app_state}.{os.getpid()}")
+    with _lock:
+        if run.profiler is not None:
+            stats = _stats.get(run.app_state)
+            if stats is None:
+                stats = _stats[run.app_state] = pstats.Stats(run.profiler)
+            else:
+                stats.add(run.profiler)
+            stats.dump_stats(base + ".pstats")
+        if samples:
+            # La radice dello stack è l'app_state: più pagine si possono unire in un solo flamegraph
+            stacks = _stacks.setdefault(run.app_state, Counter())
+            for stack, count in samples.items():
+                stacks[f"app_state={run.app_state};{stack}"] += count
+            tmp_path = f"{base}.collapsed.tmp"
+            with open(tmp_path, "w") as f:
+                for stack, count in stacks.items():
+                    f.write(f"{stack} {count}\n")
+            os.replace(tmp_path, base + ".collapsed")
+    logger.info("Run di %s profilato (%s) in %.3fs", run.app_state, run.mode, time.perf_counter() - run.started)
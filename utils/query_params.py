@@ -0,0 +1,30 @@
+import streamlit as st
+
+
+def get_query_param(name, default=None):
+    # st.query_params esiste da Streamlit 1.30; prima solo l'API sperimentale
+    if hasattr(st, "query_params"):
+        value = st.query_params.get(name)
+        return value if value is not None else default
+    values = st.experimental_get_query_params().get(name)
+    return values[0] if values else default
+
+
+def set_query_param(name, value):
+    if hasattr(st, "query_params"):
+        st.query_params[name] = value
+        return
+    # L'API sperimentale sostituisce tutti i parametri: si conservano gli altri
+    params = st.experimental_get_query_params()
+    params[name] = [value]
+    st.experimental_set_query_params(**params)
+
+
+def remove_query_param(name):
+    if hasattr(st, "query_params"):
+        if name in st.query_params:
+            del st.query_params[name]
+        return
+    params = st.experimental_get_query_params()
+    params.pop(name, None)
+    st.experimental_set_query_params(**params)
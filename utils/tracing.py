@@ -0,0 +1,323 @@
+"""Span per partecipante lungo tutto lo studio, esportati in OTLP/JSON.
+
+Una traccia per sessione: l'id deriva dal token della sessione, quindi un reload (anche su
+un'altra replica) continua la stessa traccia. Gli span di fase coprono il tempo passato in
+ogni app_state; visualizzazioni delle opere, chiamate al modello (un figlio per tentativo)
+e salvataggio finale sono figli della fase in corso. analysis/trace_timeline.py ricostruisce
+il percorso di un partecipante. Lo span participant.mongo_write, emesso dal thread di flush,
+va dall'ingresso nel journal locale alla scrittura su MongoDB, retry compresi.
+
+Configurazione in secrets.toml (senza path né endpoint il tracing è spento):
+    [tracing]
+    sample_rate = 0.1                                 # frazione di sessioni tracciate
+    path = "data/traces.jsonl"                        # una richiesta OTLP/JSON per riga
+    endpoint = "http://127.0.0.1:4318/v1/traces"      # oppure un collector OTLP/HTTP
+    service_name = "studio-artistico"
+"""
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import namedtuple
+
+import requests
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVICE_NAME = "studio-artistico"
+SCOPE_NAME = "studio-artistico.tracing"
+MAX_BATCH = 512
+FLUSH_WINDOW = 2.0
+MAX_PENDING = 10000
+STATUS_OK, STATUS_ERROR = 1, 2
+
+# Chiave interna in session_state, mai salvata nello store delle sessioni
+_TRACE_KEY = "_trace"
+
+SpanContext = namedtuple("SpanContext", ["trace_id", "span_id", "participant_id"])
+_current = contextvars.ContextVar("trace_context", default=None)
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def _otlp_span(name, context, parent_id, start_ns, end_ns, attributes, error=None):
+    span = {
+        "traceId": context.trace_id,
+        "spanId": context.span_id,
+        "name": name,
+        "kind": 1,
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(end_ns),
+        "attributes": [_attribute(key, value) for key, value in attributes.items() if value is not None],
+        "status": {"code": STATUS_ERROR, "message": error} if error else {"code": STATUS_OK},
+    }
+    if parent_id:
+        span["parentSpanId"] = parent_id
+    if context.participant_id:
+        span["attributes"].append(_attribute("participant.id", context.participant_id))
+    return span
+
+
+class SpanExporter:
+    """Raccoglie gli span chiusi e li scrive a blocchi, in un file JSONL o verso un collector"""
+
+    def __init__(self, path=None, endpoint=None, service_name=DEFAULT_SERVICE_NAME,
+                 max_batch=MAX_BATCH, window=FLUSH_WINDOW):
+        self.path = path
+        self.endpoint = endpoint
+        self.resource = {"attributes": [_attribute("service.name", service_name),
+                                        _attribute("process.pid", os.getpid())]}
+        self.max_batch = max_batch
+        self.window = window
+        self.exported = 0
+        self.dropped = 0
+        self.last_error = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="tracing-export", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self.flush()
+
+    def add(self, span):
+        with self._lock:
+            # Con l'export bloccato si perdono span piuttosto che memoria
+            if len(self._pending) >= MAX_PENDING:
+                self.dropped += 1
+                return
+            self._pending.append(span)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.window)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            request = {"resourceSpans": [{
+                "resource": self.resource,
+                "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": batch}],
+            }]}
+            try:
+                if self.path:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    with open(self.path, "a") as f:
+                        f.write(json.dumps(request) + "\n")
+                if self.endpoint:
+                    requests.post(self.endpoint, json=request, timeout=5).raise_for_status()
+            except Exception as e:
+                # Le tracce sono diagnostica: un blocco perso non deve fermare l'app
+                self.dropped += len(batch)
+                self.last_error = str(e)
+                logger.warning("Export di %d span non riuscito: %s", len(batch), e)
+                return 0
+            self.last_error = None
+            self.exported += len(batch)
+            return len(batch)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {"pending_spans": pending, "exported_spans": self.exported,
+                "dropped_spans": self.dropped, "last_error": self.last_error}
+
+
+# Come per le metriche, l'exporter vive quanto il processo e non in cache_resource
+_exporter_lock = threading.Lock()
+_exporter = {"configured": False, "instance": None, "sample_rate": 1.0}
+
+
+def get_exporter():
+    if _exporter["configured"]:
+        return _exporter["instance"]
+    with _exporter_lock:
+        if not _exporter["configured"]:
+            try:
+                settings = st.secrets.get("tracing", {})
+            except Exception:
+                settings = {}
+            if settings.get("path") or settings.get("endpoint"):
+                exporter = SpanExporter(settings.get("path"), settings.get("endpoint"),
+                                        settings.get("service_name", DEFAULT_SERVICE_NAME)).start()
+                atexit.register(exporter.stop)
+                _exporter["instance"] = exporter
+                _exporter["sample_rate"] = float(settings.get("sample_rate", 1.0))
+            _exporter["configured"] = True
+    return _exporter["instance"]
+
+
+def _new_span_id():
+    return secrets.token_hex(8)
+
+
+def _trace_for_token(token):
+    """Id della traccia e decisione di campionamento, stabili per token (reload e repliche)"""
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    sampled = int(digest[32:40], 16) / 0xFFFFFFFF < _exporter["sample_rate"]
+    return digest[:32], sampled
+
+
+def _emit(name, context, parent_id, start_ns, end_ns, attributes, error=None):
+    exporter = get_exporter()
+    if exporter is not None:
+        exporter.add(_otlp_span(name, context, parent_id, start_ns, end_ns, attributes, error))
+
+
+def _close_phase(trace, now_ns):
+    phase = trace.get("phase")
+    if phase:
+        context = SpanContext(trace["trace_id"], phase["span_id"], st.session_state.get("participant_id"))
+        _emit(f"phase {phase['name']}", context, None, phase["start_ns"], now_ns,
+              {"app_state": phase["name"], "script_runs": phase["runs"]})
+        trace["phase"] = None
+
+
+def begin_run(app_state):
+    """Da chiamare a ogni run in main_app: chiude la fase precedente se app_state è cambiato
+    e imposta il contesto per gli span del run"""
+    from database.session_store import current_token
+
+    token = current_token()
+    if get_exporter() is None or not token:
+        _current.set(None)
+        return
+
+    trace = st.session_state.get(_TRACE_KEY)
+    if trace is None or trace["token"] != token:
+        trace_id, sampled = _trace_for_token(token)
+        trace = st.session_state[_TRACE_KEY] = {"token": token, "trace_id": trace_id, "sampled": sampled,
+                                                "ended": False, "phase": None}
+    if not trace["sampled"] or trace["ended"]:
+        _current.set(None)
+        return
+
+    phase = trace["phase"]
+    if phase is None or phase["name"] != app_state:
+        now_ns = time.time_ns()
+        _close_phase(trace, now_ns)
+        phase = trace["phase"] = {"name": app_state, "span_id": _new_span_id(), "start_ns": now_ns, "runs": 0}
+    phase["runs"] += 1
+    _current.set(SpanContext(trace["trace_id"], phase["span_id"], st.session_state.get("participant_id")))
+
+
+def end_trace():
+    """Chiude la fase in corso dopo il salvataggio finale: i run successivi non sono più tracciati"""
+    trace = st.session_state.get(_TRACE_KEY)
+    if trace and trace["sampled"] and not trace["ended"]:
+        _close_phase(trace, time.time_ns())
+        trace["ended"] = True
+    _current.set(None)
+
+
+class _NullAttributes(dict):
+    """Attributi di uno span non registrato: le scritture si perdono, il dizionario resta vuoto"""
+
+    def __setitem__(self, key, value):
+        pass
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return _NULL_ATTRIBUTES
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_ATTRIBUTES = _NullAttributes()
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.context = parent._replace(span_id=_new_span_id())
+
+    def __enter__(self):
+        self._reset = _current.set(self.context)
+        self.start_ns = time.time_ns()
+        return self.attributes
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._reset)
+        # Solo le eccezioni vere segnano errore, non i BaseException di controllo (st.rerun, st.stop)
+        error = f"{exc_type.__name__}: {exc}" if exc_type and issubclass(exc_type, Exception) else None
+        _emit(self.name, self.context, self.parent.span_id, self.start_ns, time.time_ns(), self.attributes, error)
+        return False
+
+
+def span(name, attributes=None):
+    """Span figlio del contesto corrente; il dizionario restituito da with accetta altri attributi.
+
+    Fuori da una sessione campionata restituisce un contesto vuoto condiviso, senza allocazioni.
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NOOP_SPAN
+    return _Span(name, parent, attributes)
+
+
+def record_span(name, start, end, attributes=None):
+    """Span già concluso, con inizio e fine in secondi epoch (es. i tempi salvati in session_state)"""
+    parent = _current.get()
+    if parent is not None:
+        _emit(name, parent._replace(span_id=_new_span_id()), parent.span_id,
+              int(start * 1e9), int(end * 1e9), dict(attributes or {}))
+
+
+def current_context():
+    return _current.get()
+
+
+def emit_span(context, name, start_ns, end_ns, attributes=None, error=None):
+    """Span figlio di un contesto catturato in un altro thread (es. il flush verso Mongo)"""
+    if context is not None:
+        _emit(name, context._replace(span_id=_new_span_id()), context.span_id,
+              start_ns, end_ns, dict(attributes or {}), error)
+
+
+def bind_context(func):
+    """Porta il contesto di tracing nei thread del prefetch"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
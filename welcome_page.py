@@ -1,12 +1,10 @@
 import streamlit as st
 import time
+from database.mongo_handler import generate_participant_id, save_checkpoint
+from utils.assets import inject_css
 
 def welcome_page():
-    def load_css():
-        with open("style.css") as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-
-    load_css()
+    inject_css()
 
     if st.session_state.get('consent_given', False):
         show_demographics_section()
@@ -100,6 +98,11 @@ def show_demographics_section():
                     'art_familiarity': art_familiarity,
                     'museum_visits': museum_visits
                 }
+                if 'participant_id' not in st.session_state:
+                    st.session_state.participant_id = generate_participant_id()
+                save_checkpoint(st.session_state.participant_id, "demographics", {
+                    'demographics': st.session_state.demographics
+                })
                 st.session_state.app_state = "interests"
                 st.rerun()
             else: